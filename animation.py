@@ -0,0 +1,231 @@
+"""
+Streaming upscaling of animated GIF and WebP uploads
+
+The pipeline used to treat an animation like a still and upscale its first
+frame only. Doing every frame the obvious way means holding them all
+decoded, then all upscaled, before Pillow's save_all encodes a byte.
+upscale_animation runs three stages at once instead, each in its own
+thread, joined by queues PIXELFORGE_ANIMATION_DEPTH frames deep:
+
+    decode    seek through the frames; Pillow composites GIF disposal and
+              WebP blending, so each comes out as a full frame
+    upscale   each frame to every preset, unless it repeats the last frame
+              upscaled to within PIXELFORGE_ANIMATION_TOLERANCE per channel
+    encode    add each frame to a libwebp animation encoder per preset
+
+A repeated frame is neither upscaled nor encoded: the frame before it stays
+on screen for longer. A full queue blocks the stage feeding it, so memory
+depends on the depth and the frame size, not the frame count. The animation
+encoder itself keeps only compressed frames.
+
+Animations come out as animated WebP, since GIF's 256 colours would undo
+the upscale. webp and jpeg requests get lossy WebP at their quality, and
+png and webp-lossless requests get lossless WebP.
+"""
+import os
+import queue
+import threading
+import time
+
+from PIL import Image, ImageChops, features
+
+from encoding import OutputFormat
+from transparency import prepare_image
+
+try:
+    from PIL import _webp
+except ImportError:
+    _webp = None  # no animated WebP: animations are upscaled as their first frame
+
+ANIMATED_WEBP = _webp is not None and features.check("webp_anim")
+
+# Frames each queue between the stages may hold
+ANIMATION_DEPTH = int(os.environ.get("PIXELFORGE_ANIMATION_DEPTH", 2))
+
+# Largest per-channel difference at which a frame counts as a repeat (0: identical only)
+ANIMATION_TOLERANCE = int(os.environ.get("PIXELFORGE_ANIMATION_TOLERANCE", 2))
+
+# For frames without a duration, as browsers show them
+DEFAULT_FRAME_MS = 100
+
+_END = object()
+
+
+class _Failed:
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def is_animated(img: Image.Image) -> bool:
+    """Whether an opened image has more than one frame to upscale"""
+    return ANIMATED_WEBP and getattr(img, "is_animated", False)
+
+
+def animated_output(output: OutputFormat) -> OutputFormat:
+    """The animated WebP format standing in for an output format: lossy for lossy formats, else lossless"""
+    if output.name in ("webp", "webp-lossless"):
+        return output
+    if output.name == "jpeg":
+        return OutputFormat("webp", output.quality, "flatten")
+    return OutputFormat("webp-lossless", None, output.alpha)
+
+
+def buffered(items, depth: int, name: str):
+    """
+    Iterate items in a thread of their own, at most depth items ahead of the consumer
+    Errors are raised in the consumer; closing this iterator stops the thread
+    """
+    results = queue.Queue(depth)
+    stopped = threading.Event()
+
+    def put(item) -> bool:
+        while not stopped.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        iterator = iter(items)
+        try:
+            for item in iterator:
+                if not put(item):
+                    return
+            put(_END)
+        except BaseException as e:
+            put(_Failed(e))
+        finally:
+            # Let an upstream stage stop too
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    thread = threading.Thread(target=produce, name=name, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = results.get()
+            if item is _END:
+                return
+            if isinstance(item, _Failed):
+                raise item.error
+            yield item
+    finally:
+        stopped.set()
+
+
+def decode_frames(img: Image.Image, keep_alpha: bool, timings, label: str):
+    """Each frame, prepared for the upscalers, with its duration in milliseconds"""
+    seconds = 0.0
+    try:
+        for index in range(img.n_frames):
+            start = time.perf_counter()
+            img.seek(index)
+            img.load()
+            frame = prepare_image(img, keep_alpha)
+            # The next seek reuses img, so the frame needs a copy of its own
+            if frame is img:
+                frame = img.copy()
+            seconds += time.perf_counter() - start
+            yield frame, img.info.get("duration") or DEFAULT_FRAME_MS
+    finally:
+        timings.add("decode", seconds, label)
+
+
+def same_frame(previous: Image.Image, frame: Image.Image, tolerance: int) -> bool:
+    """Whether every channel of every pixel is within tolerance of the previous frame"""
+    if previous.mode != frame.mode or previous.size != frame.size:
+        return False
+    difference = ImageChops.difference(previous, frame).getextrema()
+    return max(high for _, high in difference) <= tolerance
+
+
+def upscale_frames(frames, upscale, tolerance: int):
+    """upscale(frame) for each frame, or None for a repeat of the last frame upscaled"""
+    previous = None
+    try:
+        for frame, duration in frames:
+            if previous is not None and same_frame(previous, frame, tolerance):
+                yield None, duration
+                continue
+            previous = frame
+            yield upscale(frame), duration
+    finally:
+        frames.close()
+
+
+class AnimationEncoder:
+    """Animated WebP encoder fed one frame at a time; the file is assembled at the end"""
+
+    def __init__(self, size: tuple, output: OutputFormat, loop: int = 0):
+        options = output.save_options()
+        self.lossless = options.get("lossless", False)
+        self.quality = options["quality"]
+        self.method = options["method"]
+        self.timestamp = 0
+        self.frames = 0
+        # Keyframe spacing as in Pillow's save_all (from gif2webp)
+        kmin, kmax = (9, 17) if self.lossless else (3, 5)
+        self._encoder = _webp.WebPAnimEncoder(size[0], size[1], 0, loop, False, kmin, kmax, False, False)
+
+    def add(self, frame: Image.Image, duration: float):
+        """Show frame for duration milliseconds; None holds the previous frame that much longer"""
+        if frame is not None:
+            rawmode = "RGBA" if frame.mode == "RGBA" else "RGBX"
+            self._encoder.add(
+                frame.tobytes("raw", rawmode), round(self.timestamp), frame.size[0], frame.size[1], rawmode,
+                self.lossless, self.quality, self.method
+            )
+            self.frames += 1
+        self.timestamp += duration
+
+    def finish(self) -> bytes:
+        self._encoder.add(None, round(self.timestamp), 0, 0, "", self.lossless, self.quality, 0)
+        data = self._encoder.assemble("", "", "")
+        if data is None:
+            raise OSError("cannot write file as WebP (encoder returned None)")
+        return data
+
+
+def upscale_animation(img: Image.Image, resolutions: list, output: OutputFormat, upscale, timings,
+                      progress=None) -> dict:
+    """
+    Upscale every frame of an animated image and encode each preset as animated WebP
+    upscale(frame) returns a dict of upscaled frames per preset
+    Returns a dict of encoded bytes per preset
+    """
+    progress = progress or (lambda stage, fraction: None)
+    output = animated_output(output)
+    frame_count = img.n_frames
+    loop = img.info.get("loop", 0)
+    label = resolutions[0] if len(resolutions) == 1 else "all"
+
+    frames = buffered(decode_frames(img, output.keep_alpha, timings, label), ANIMATION_DEPTH, "animation-decode")
+    upscaled = buffered(upscale_frames(frames, upscale, ANIMATION_TOLERANCE), ANIMATION_DEPTH, "animation-upscale")
+    encoders = {}
+    encode_seconds = dict.fromkeys(resolutions, 0.0)
+    repeats = 0
+    try:
+        for index, (presets, duration) in enumerate(upscaled):
+            progress(f"frame {index + 1}/{frame_count}", 0.05 + 0.9 * index / frame_count)
+            repeats += presets is None
+            for resolution in resolutions:
+                frame = presets[resolution] if presets is not None else None
+                start = time.perf_counter()
+                if resolution not in encoders:
+                    encoders[resolution] = AnimationEncoder(frame.size, output, loop)
+                encoders[resolution].add(frame, duration)
+                encode_seconds[resolution] += time.perf_counter() - start
+    finally:
+        upscaled.close()
+
+    outputs = {}
+    for resolution, encoder in encoders.items():
+        start = time.perf_counter()
+        outputs[resolution] = encoder.finish()
+        seconds = encode_seconds[resolution] + time.perf_counter() - start
+        timings.add("encode", seconds, resolution, timings.engines.get(resolution, ""))
+    print(f"Animation: {frame_count} frames, {repeats} repeated frames reused")
+    return outputs
@@ -0,0 +1,214 @@
+"""
+Many images per request, or per command
+
+POST /api/batch takes several files, or one ZIP of them, and answers with a
+ZIP that is streamed as each image finishes. A shop upscaling a catalogue
+then pays for multipart parsing, rate limiting and model warm-up once per
+batch instead of once per image. Images run concurrently in the server's
+worker pool. By the time one fails the response has started, so failures
+are listed in errors.txt inside the archive rather than failing the batch.
+
+The servers can also be run offline over a directory, e.g.
+
+    python server_ai.py batch photos/ upscaled/ --resolution 4k
+
+which spreads the files over a process pool and prints throughput.
+"""
+import argparse
+import asyncio
+import os
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from fastapi import HTTPException
+
+from encoding import ALPHA_MODES, OUTPUT_FORMATS, resolve_output_format
+from uploads import pipeline_source, upload_size
+from worker_pool import PoolFullError
+
+
+class ZipStream:
+    """Write-only sink for zipfile, drained after every entry so the archive can be streamed"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        # Without tell() zipfile writes data descriptors instead of seeking back
+        self._archive = zipfile.ZipFile(self, "w", zipfile.ZIP_STORED)
+        self._names = set()
+
+    def write(self, data) -> int:
+        self._buffer += data
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def add(self, name: str, data: bytes) -> bytes:
+        """Append an entry (renamed if taken) and return the archive bytes it produced"""
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while name in self._names:
+            n += 1
+            name = f"{stem}-{n}{ext}"
+        self._names.add(name)
+        self._archive.writestr(name, data)
+        return self._take()
+
+    def close(self) -> bytes:
+        """Write the central directory and return the remaining bytes"""
+        self._archive.close()
+        return self._take()
+
+    def _take(self) -> bytes:
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+def batch_inputs(files: list, extensions: set, max_files: int, max_file_size: int, pool_kind: str) -> list:
+    """
+    (name, load) pairs for the images in a batch upload: the uploaded files,
+    or the members of a single uploaded ZIP. load() returns what to send to
+    the worker pool, and ZIP members are only decompressed when it is called
+    """
+    if len(files) == 1 and files[0].filename.lower().endswith(".zip"):
+        try:
+            archive = zipfile.ZipFile(files[0].file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Invalid ZIP file")
+        members = [
+            info for info in archive.infolist()
+            if not info.is_dir() and not info.filename.startswith("__MACOSX/")
+            and Path(info.filename).suffix.lower().lstrip(".") in extensions
+        ]
+        sized = [(Path(info.filename).name, info.file_size, lambda info=info: archive.read(info)) for info in members]
+    else:
+        sized = [
+            (f.filename, upload_size(f.file), lambda f=f: pipeline_source(f.file, pool_kind)) for f in files
+        ]
+
+    if not sized:
+        raise HTTPException(status_code=400, detail="No images found in the batch")
+    if len(sized) > max_files:
+        raise HTTPException(status_code=413, detail=f"Too many images. Maximum per batch: {max_files}")
+    for name, size, _ in sized:
+        if size > max_file_size:
+            raise HTTPException(
+                status_code=413,
+                detail=f"{name} is too large. Maximum size: {max_file_size // (1024*1024)}MB"
+            )
+    return [(name, load) for name, _, load in sized]
+
+
+async def stream_batch(inputs: list, process, concurrency: int):
+    """
+    Async iterator over a ZIP of the batch results, in completion order
+    process(name, source) is a coroutine returning a list of (entry name, data)
+    """
+    archive = ZipStream()
+    semaphore = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def run(name, load):
+        async with semaphore:
+            # Decompressing a ZIP member blocks, so it runs off the event loop
+            source = await asyncio.to_thread(load)
+            while True:
+                try:
+                    return await process(name, source)
+                except PoolFullError as e:
+                    # Other requests hold the pool: wait for a slot rather than drop the image
+                    await asyncio.sleep(e.retry_after)
+
+    tasks = {asyncio.ensure_future(run(name, load)): name for name, load in inputs}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    entries = task.result()
+                except Exception as e:
+                    detail = getattr(e, "detail", None)
+                    print(f"Batch item {tasks[task]} failed: {detail or e}")
+                    errors.append(f"{tasks[task]}: {detail or 'processing failed'}")
+                    continue
+                for entry, data in entries:
+                    yield archive.add(entry, data)
+        if errors:
+            yield archive.add("errors.txt", ("\n".join(errors) + "\n").encode())
+        yield archive.close()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _upscale_one(upscale_file, path: str, output_dir: str, args: tuple):
+    """Runs in a CLI worker process; failures come back as text, since HTTPException does not pickle"""
+    try:
+        return upscale_file(path, output_dir, *args), None
+    except Exception as e:
+        return None, str(getattr(e, "detail", None) or e)
+
+
+def run_directory(upscale_file, input_dir: str, output_dir: str, args: tuple, extensions: set,
+                  workers: int = None, initializer=None):
+    """
+    Upscale every image in input_dir into output_dir across a process pool
+    upscale_file(path, output_dir, *args) returns (written names, output pixels);
+    initializer(workers), if given, runs once in each worker process
+    """
+    paths = sorted(p for p in Path(input_dir).iterdir() if p.suffix.lower().lstrip(".") in extensions)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    print(f"Upscaling {len(paths)} images from {input_dir} with {workers} worker processes")
+
+    done = failed = 0
+    pixels = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=initializer, initargs=(workers,) if initializer else ()) as executor:
+        futures = {
+            executor.submit(_upscale_one, upscale_file, str(path), str(output_dir), args): path for path in paths
+        }
+        for future in as_completed(futures):
+            result, error = future.result()
+            if error is not None:
+                failed += 1
+                print(f"  FAILED {futures[future].name}: {error}")
+                continue
+            names, output_pixels = result
+            done += 1
+            pixels += output_pixels
+            print(f"  {futures[future].name} -> {', '.join(names)}")
+    elapsed = time.perf_counter() - start
+
+    print(f"{done} images upscaled, {failed} failed, in {elapsed:.1f}s")
+    if elapsed > 0:
+        print(f"Throughput: {done / elapsed:.2f} images/s, {pixels / elapsed / 1e6:.1f} output megapixels/s")
+    return done, failed, elapsed
+
+
+def batch_cli(argv: list, upscale_file, resolutions: list, extensions: set, initializer=None):
+    """Parse `batch INPUT_DIR OUTPUT_DIR [options]` and run it with run_directory"""
+    parser = argparse.ArgumentParser(prog="batch", description="Upscale every image in a directory")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--resolution", choices=resolutions, default=resolutions[0])
+    parser.add_argument("--output-format", choices=list(OUTPUT_FORMATS), default="png")
+    parser.add_argument("--quality", type=int, help="level for the output format (see /api/upscale)")
+    parser.add_argument("--alpha", choices=ALPHA_MODES, default="flatten",
+                        help="keep transparency in PNG/WebP output, or flatten it onto white")
+    parser.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    try:
+        output = resolve_output_format(args.output_format, args.quality, alpha=args.alpha)
+    except HTTPException as e:
+        parser.error(e.detail)
+    done, failed, _ = run_directory(
+        upscale_file, args.input_dir, args.output_dir, (args.resolution, output), extensions,
+        args.workers, initializer
+    )
+    return 1 if failed else 0
@@ -0,0 +1,92 @@
+"""
+Cross-request micro-batching for model inference
+
+Worker threads hand their tiles or images to a single BatchScheduler instead
+of calling the model themselves. The scheduler thread collects items until
+max_batch_size is reached or max_wait_ms has passed since the first one
+arrived, runs one batched forward per input shape, and scatters the rows
+back to the waiting callers. Only one forward runs at a time, so PyTorch's
+intra-op threads are not split between competing requests.
+"""
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+import torch
+
+
+class BatchScheduler:
+    """Callable stand-in for a model that batches calls from many threads"""
+
+    def __init__(self, model, max_batch_size: int = 4, max_wait_ms: float = 10):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.batches = 0
+        self.items = 0
+        self.wait_total = 0.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+        self._thread.start()
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        """Run an (N, C, H, W) tensor through the model, blocking until done"""
+        futures = [self.submit(inputs[i:i + 1]) for i in range(inputs.shape[0])]
+        return torch.cat([future.result() for future in futures])
+
+    def submit(self, item: torch.Tensor) -> Future:
+        """Queue a single (1, C, H, W) item and return a future for its output"""
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, batch: list):
+        # Items of different sizes cannot share a tensor, so forward each shape separately
+        groups = {}
+        for entry in batch:
+            groups.setdefault(tuple(entry[0].shape), []).append(entry)
+
+        now = time.perf_counter()
+        for entries in groups.values():
+            try:
+                with torch.no_grad():
+                    outputs = self.model(torch.cat([item for item, _, _ in entries]))
+            except Exception as e:
+                for _, future, _ in entries:
+                    future.set_exception(e)
+                continue
+            for i, (_, future, _) in enumerate(entries):
+                future.set_result(outputs[i:i + 1])
+            self.batches += 1
+
+        self.items += len(batch)
+        self.wait_total += sum(now - queued for _, _, queued in batch)
+
+    def _loop(self):
+        while True:
+            self._run(self._collect())
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0,
+            "avg_wait_ms": round(self.wait_total / self.items * 1000, 2) if self.items else 0,
+            "queued": self._queue.qsize(),
+        }
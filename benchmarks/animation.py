@@ -0,0 +1,115 @@
+"""
+Time and peak memory of animated upscaling, streamed against whole-animation buffering
+
+Each case is a synthetic lossless animated WebP of --frames frames, made
+from the bundled test image, in which every distinct frame is held for
+--repeat frames. It is upscaled to a preset with Lanczos, in two modes:
+
+    streamed   animation.upscale_animation: decode, upscale and encode
+               concurrently, with repeated frames skipped
+    buffered   every frame decoded, then every frame upscaled, then one
+               Pillow save_all
+
+Reported per case: milliseconds, the RSS high-water mark above the RSS
+before the run, and the frames actually upscaled. The streamed peak should
+stay flat as the frame count grows.
+
+Usage (from the repository root):
+    python -m benchmarks.animation
+    python -m benchmarks.animation --frames 8,32,128 --json before.json
+"""
+import argparse
+import gc
+import io
+import time
+
+from PIL import Image, ImageSequence
+
+import animation
+from benchmarks.common import TEST_IMAGES, current_rss_mb, high_water_rss_mb, reset_peak_rss, write_results
+from encoding import OutputFormat
+from metrics import StageTimings
+from resampling import resize
+
+PRESETS = {"2k": (2560, 1440), "4k": (3840, 2160)}
+
+
+def make_animation(frames: int, repeat: int, size: tuple) -> bytes:
+    """A lossless WebP panning across the test image, each position held for repeat frames"""
+    source = Image.open(TEST_IMAGES[0]).convert("RGB").resize((size[0] * 2, size[1]), Image.LANCZOS)
+    distinct = -(-frames // repeat)
+    images = []
+    for index in range(frames):
+        left = (index // repeat) * size[0] // max(distinct, 1)
+        frame = source.crop((left, 0, left + size[0], size[1]))
+        # A one-level difference, so the encoder keeps the repeats as frames of their own
+        frame.putpixel((0, 0), tuple(min(255, v + index % 2) for v in frame.getpixel((0, 0))))
+        images.append(frame)
+    buffer = io.BytesIO()
+    images[0].save(buffer, format="WEBP", save_all=True, append_images=images[1:], duration=80, loop=0,
+                   lossless=True)
+    return buffer.getvalue()
+
+
+def streamed(data: bytes, size: tuple, output: OutputFormat) -> int:
+    upscaled = []
+
+    def upscale(frame):
+        upscaled.append(1)
+        return {"preset": resize(frame, size)}
+
+    animation.upscale_animation(Image.open(io.BytesIO(data)), ["preset"], output, upscale, StageTimings())
+    return len(upscaled)
+
+
+def buffered(data: bytes, size: tuple, output: OutputFormat) -> int:
+    img = Image.open(io.BytesIO(data))
+    frames = [frame.convert("RGB") for frame in ImageSequence.Iterator(img)]
+    durations = [frame.info.get("duration", 80) for frame in ImageSequence.Iterator(img)]
+    upscaled = [resize(frame, size) for frame in frames]
+    upscaled[0].save(io.BytesIO(), format="WEBP", save_all=True, append_images=upscaled[1:], duration=durations,
+                     **animation.animated_output(output).save_options())
+    return len(upscaled)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--frames", default="8,32,96")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--size", default="320x180")
+    parser.add_argument("--preset", choices=list(PRESETS), default="2k")
+    parser.add_argument("--output-format", default="webp")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    source_size = tuple(int(v) for v in args.size.split("x"))
+    output = OutputFormat(args.output_format)
+    preset_size = PRESETS[args.preset]
+    scale = min(preset_size[0] / source_size[0], preset_size[1] / source_size[1])
+    size = (round(source_size[0] * scale), round(source_size[1] * scale))
+
+    print(f"{'frames':>7} {'mode':>9} {'ms':>9} {'peak MB':>8} {'upscaled':>9}")
+    results = []
+    for frames in (int(f) for f in args.frames.split(",")):
+        data = make_animation(frames, args.repeat, source_size)
+        for mode, run in (("streamed", streamed), ("buffered", buffered)):
+            gc.collect()
+            baseline = current_rss_mb()
+            reset_peak_rss()
+            start = time.perf_counter()
+            upscaled = run(data, size, output)
+            row = {
+                "frames": frames, "mode": mode,
+                "ms": round((time.perf_counter() - start) * 1000, 1),
+                "peak_mb": round(high_water_rss_mb() - baseline, 1),
+                "upscaled": upscaled,
+            }
+            results.append(row)
+            print(f"{frames:>7} {mode:>9} {row['ms']:>9} {row['peak_mb']:>8} {upscaled:>9}")
+
+    if args.json:
+        write_results(args.json, "animation", ["frames", "mode"], ["ms", "peak_mb"], [], results, vars(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Helpers shared by the benchmark scripts"""
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+TEST_IMAGES = [REPO_DIR / "test_640x360.jpg", REPO_DIR / "test_720x405.jpg"]
+
+
+def load_model(random_weights: bool, scale: int = 4):
+    """Load pretrained EDSR, or an untrained one of the same shape for offline runs"""
+    from super_image import EdsrConfig, EdsrModel
+    if random_weights:
+        model = EdsrModel(EdsrConfig(scale=scale))
+    else:
+        model = EdsrModel.from_pretrained('eugenesiow/edsr-base', scale=scale)
+    return model.eval()
+
+
+def patch_random_weights():
+    """Make EdsrModel.from_pretrained build an untrained model, so servers can be benchmarked offline"""
+    from super_image import EdsrConfig, EdsrModel
+    EdsrModel.from_pretrained = classmethod(lambda cls, name, scale=4, **kwargs: cls(EdsrConfig(scale=scale)))
+
+
+def current_rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * resource.getpagesize() / (1024 * 1024)
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def reset_peak_rss():
+    """Restart the VmHWM high-water mark (Linux), so high_water_rss_mb covers only what follows"""
+    with open("/proc/self/clear_refs", "w") as f:
+        f.write("5")
+
+
+def high_water_rss_mb() -> float:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1]) / 1024
+    return peak_rss_mb()
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def psnr(reference, candidate) -> float:
+    """PSNR in dB between two same-sized 8-bit images (PIL images or arrays)"""
+    a = np.asarray(reference, dtype=np.float64)
+    b = np.asarray(candidate, dtype=np.float64)
+    mse = ((a - b) ** 2).mean()
+    return float("inf") if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+
+
+def run_metadata() -> dict:
+    """Commit, versions and machine a result was measured on, so files from different commits can be compared"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    versions = {}
+    for name in ("torch", "PIL", "numpy", "fastapi"):
+        module = sys.modules.get(name)
+        versions[name] = getattr(module, "__version__", None) if module else None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+        "env": {k: v for k, v in os.environ.items() if k.startswith("PIXELFORGE_")},
+    }
+
+
+def write_results(path: str, benchmark: str, keys: list, lower_is_better: list, higher_is_better: list,
+                  results: list, settings: dict):
+    """
+    Write results in the layout benchmarks.compare reads: records identified by
+    the keys fields, and the metrics to compare in either direction
+    """
+    Path(path).write_text(json.dumps({
+        "benchmark": benchmark,
+        "metadata": run_metadata(),
+        "settings": settings,
+        "keys": keys,
+        "lower_is_better": lower_is_better,
+        "higher_is_better": higher_is_better,
+        "results": results,
+    }, indent=2))
+
+
+def tree_rss_mb(pid: int) -> float:
+    """Resident memory of a process and all its descendants (Linux)"""
+    total = 0.0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            with open(f"/proc/{current}/statm") as f:
+                total += int(f.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+            with open(f"/proc/{current}/task/{current}/children") as f:
+                pending.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return total
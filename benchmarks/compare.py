@@ -0,0 +1,72 @@
+"""
+Compare two benchmark result files and flag regressions
+
+Reads files written with --json by benchmarks.pipeline and
+benchmarks.load_test (e.g. one from the main branch, one from a change),
+matches their records on the file's key fields and prints the change of
+every metric. A metric that got worse by more than --threshold percent, in
+its own direction (latency up, throughput down), is a regression, and the
+exit status is 1 if there were any.
+
+Usage (from the repository root):
+    git checkout main && python -m benchmarks.pipeline --random-weights --json before.json
+    git checkout my-branch && python -m benchmarks.pipeline --random-weights --json after.json
+    python -m benchmarks.compare before.json after.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        data = json.load(f)
+    if "keys" not in data:
+        sys.exit(f"{path} has no key fields; only files written by pipeline and load_test can be compared")
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10.0, help="percent change counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=1.0,
+                        help="ignore latency metrics below this in both files (timer noise)")
+    args = parser.parse_args()
+
+    baseline, candidate = load(args.baseline), load(args.candidate)
+    if baseline["benchmark"] != candidate["benchmark"]:
+        sys.exit(f"Cannot compare {baseline['benchmark']} results with {candidate['benchmark']} results")
+    keys = baseline["keys"]
+    directions = {metric: 1 for metric in baseline["lower_is_better"]}
+    directions.update({metric: -1 for metric in baseline["higher_is_better"]})
+
+    print(f"{baseline['benchmark']}: {baseline['metadata'].get('commit')} -> {candidate['metadata'].get('commit')}")
+    before = {tuple(row[k] for k in keys): row for row in baseline["results"]}
+    regressions = 0
+    for row in candidate["results"]:
+        key = tuple(row[k] for k in keys)
+        old = before.get(key)
+        if old is None:
+            print(f"  {'/'.join(map(str, key))}: new")
+            continue
+        changes = []
+        for metric, direction in directions.items():
+            a, b = old.get(metric), row.get(metric)
+            if not isinstance(a, (int, float)) or not isinstance(b, (int, float)) or a == 0:
+                continue
+            if metric.endswith("_ms") and max(a, b) < args.min_ms:
+                continue
+            change = (b - a) / a * 100
+            worse = change * direction > args.threshold
+            regressions += worse
+            changes.append(f"{metric} {a:g} -> {b:g} ({change:+.1f}%){' REGRESSION' if worse else ''}")
+        print(f"  {'/'.join(map(str, key))}: " + ("; ".join(changes) or "no comparable metrics"))
+
+    print(f"{regressions} regression(s) above {args.threshold:g}%")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
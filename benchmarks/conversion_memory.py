@@ -0,0 +1,115 @@
+"""
+Per-request memory of the PIL <-> tensor conversions, before and after conversion.py
+
+A nearest-neighbour upsample stands in for EDSR, so the numbers isolate the
+conversions around the model: "imageloader" is the old path
+(ImageLoader.load_image, then mul/clamp/round/cast/permute and
+Image.fromarray), "conversion" is image_to_tensor, tensor_to_array and
+array_to_image with a BufferPool. Each (size, path) runs in a fresh process
+with glibc's mmap threshold pinned, so freed buffers leave RSS and the peak
+RSS over each request (VmHWM, reset between requests) is what it allocated.
+The first request fills the pool; later ones show the steady state.
+
+Usage (from the repository root):
+    python -m benchmarks.conversion_memory
+    python -m benchmarks.conversion_memory --sizes 640x360,960x540 --scale 4 --requests 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from benchmarks.common import TEST_IMAGES, current_rss_mb, high_water_rss_mb, reset_peak_rss
+
+PATHS = ("imageloader", "conversion")
+
+
+def run_one(path_name, size, scale, requests, queue):
+    """Child process: convert and "upscale" the same image several times, reporting each request's peak"""
+    import numpy as np
+    import torch
+    from super_image import ImageLoader
+
+    from conversion import BufferPool, array_to_image, image_to_tensor, tensor_to_array
+
+    torch.set_grad_enabled(False)
+    model = torch.nn.Upsample(scale_factor=scale, mode="nearest")
+    pool = BufferPool()
+
+    def request(img):
+        if path_name == "imageloader":
+            outputs = model(ImageLoader.load_image(img))
+            array = outputs[0].mul(255).clamp_(0, 255).round_().to(torch.uint8).permute(1, 2, 0).cpu().numpy()
+            return Image.fromarray(array)
+        outputs = model(image_to_tensor(img, pool))
+        out = pool.get("output", (img.height * scale, img.width * scale, 3), np.uint8)
+        return array_to_image(tensor_to_array(outputs[0], out))
+
+    # Load every code path on a small image first, so only buffers are measured
+    request(Image.new("RGB", (16, 16)))
+    img = Image.open(TEST_IMAGES[0]).convert('RGB').resize(size, Image.LANCZOS)
+
+    peaks, seconds = [], []
+    for _ in range(requests):
+        baseline = current_rss_mb()
+        reset_peak_rss()
+        start = time.perf_counter()
+        result = request(img)
+        seconds.append(time.perf_counter() - start)
+        peaks.append(high_water_rss_mb() - baseline)
+        del result
+    queue.put({
+        "first_request_mb": round(peaks[0], 1),
+        "steady_request_mb": round(statistics.median(peaks[1:] or peaks), 1),
+        "seconds": round(statistics.median(seconds), 4),
+        "pool_mb": round(pool.nbytes() / (1024 * 1024), 1),
+    })
+
+
+def measure(ctx, path_name, size, scale, requests) -> dict:
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_one, args=(path_name, size, scale, requests, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        return {"error": f"exit code {proc.exitcode}"}
+    return queue.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="320x180,640x360,960x540")
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=5)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # A fixed threshold keeps large buffers in their own mappings, returned to the OS on free
+    os.environ["MALLOC_MMAP_THRESHOLD_"] = str(128 * 1024)
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+
+    output_mb = lambda size: size[0] * size[1] * args.scale ** 2 * 3 / (1024 * 1024)
+    print(f"{'input':>10} {'path':>12} {'output MB':>10} {'first MB':>9} {'steady MB':>10} {'seconds':>9} {'pool MB':>8}")
+    for spec in args.sizes.split(","):
+        size = tuple(int(v) for v in spec.split("x"))
+        for path_name in PATHS:
+            result = measure(ctx, path_name, size, args.scale, args.requests)
+            results.append({"input": spec, "path": path_name, "output_mb": round(output_mb(size), 1), **result})
+            if "error" in result:
+                print(f"{spec:>10} {path_name:>12} {result['error']}")
+            else:
+                print(f"{spec:>10} {path_name:>12} {output_mb(size):>10.1f} {result['first_request_mb']:>9} "
+                      f"{result['steady_request_mb']:>10} {result['seconds']:>9} {result['pool_mb']:>8}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Encode time and output size for each output format option
+
+Each bundled test image is upscaled with Lanczos to the 2K and 4K presets,
+then encoded with the old PNG optimize=True path and every option in
+encoding.OUTPUT_FORMATS at a few quality levels.
+
+Usage (from the repository root):
+    python -m benchmarks.encoding
+    python -m benchmarks.encoding --repeat 3 --json encode.json
+"""
+import argparse
+import io
+import json
+import time
+from pathlib import Path
+
+from PIL import Image
+
+from benchmarks.common import TEST_IMAGES
+from encoding import OutputFormat, encode_image
+
+RESOLUTION_PRESETS = {"2k": (2560, 1440), "4k": (3840, 2160)}
+
+OPTIONS = [
+    ("png", 1), ("png", 3), ("png", 6), ("png", 9),
+    ("webp", 80), ("webp", 90),
+    ("webp-lossless", 0), ("webp-lossless", 25), ("webp-lossless", 75),
+    ("jpeg", 85), ("jpeg", 95),
+]
+
+
+def encode_png_optimized(img: Image.Image) -> bytes:
+    """The encoder every endpoint used before output formats were selectable"""
+    output_buffer = io.BytesIO()
+    img.save(output_buffer, format='PNG', optimize=True)
+    return output_buffer.getvalue()
+
+
+def timed(fn, repeat: int):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(data)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--presets", default="2k,4k")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of this many runs")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'image':>18} {'preset':>6} {'option':>20} {'seconds':>9} {'size KB':>9}")
+    for path in TEST_IMAGES:
+        source = Image.open(path).convert('RGB')
+        for preset in args.presets.split(","):
+            img = source.resize(RESOLUTION_PRESETS[preset], Image.LANCZOS)
+            runs = [("png optimize (old)", lambda: encode_png_optimized(img))]
+            for name, quality in OPTIONS:
+                output = OutputFormat(name, quality)
+                runs.append((f"{name} q{quality}", lambda output=output: encode_image(img, output)))
+            for label, fn in runs:
+                seconds, size = timed(fn, args.repeat)
+                results.append({"image": path.name, "preset": preset, "option": label,
+                                "seconds": round(seconds, 3), "bytes": size})
+                print(f"{path.name:>18} {preset:>6} {label:>20} {seconds:>9.3f} {size / 1024:>9.0f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Latency and PSNR of each inference backend on the bundled test images
+
+Each test image is treated as ground truth, downscaled by the model scale
+and brought back with tiled inference through every backend, in the default
+and channels-last layouts. PSNR is reported against the original and
+against the eager output, which isolates the fidelity a backend itself
+gives up. int8 is calibrated on the repository's test_*.jpg images, like
+the server's default.
+
+Usage (from the repository root):
+    python -m benchmarks.inference_backends
+    python -m benchmarks.inference_backends --backends eager,int8,onnx --threads 4 --random-weights
+"""
+import argparse
+import copy
+import json
+import time
+from pathlib import Path
+
+import torch
+from PIL import Image
+from super_image import ImageLoader
+
+from benchmarks.common import REPO_DIR, TEST_IMAGES, load_model, psnr
+from inference_backends import BACKENDS, build_backend, calibration_tiles
+from tiled_inference import tiled_upscale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backends", default=",".join(BACKENDS))
+    parser.add_argument("--layouts", default="default,channels-last")
+    parser.add_argument("--scale", type=int, default=4)
+    parser.add_argument("--tile", type=int, default=192)
+    parser.add_argument("--threads", type=int, help="torch.set_num_threads and ONNX Runtime intra-op threads")
+    parser.add_argument("--repeat", type=int, default=1, help="report the best of this many runs")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model(args.random_weights, args.scale)
+    calibration = calibration_tiles(sorted(REPO_DIR.glob("test_*.jpg")))
+
+    images = []
+    for path in TEST_IMAGES:
+        reference = Image.open(path).convert('RGB')
+        reference = reference.crop((0, 0, reference.width // args.scale * args.scale,
+                                    reference.height // args.scale * args.scale))
+        low_res = reference.resize((reference.width // args.scale, reference.height // args.scale), Image.BICUBIC)
+        images.append((path.name, reference, ImageLoader.load_image(low_res)))
+
+    results = []
+    eager_outputs = {}
+    print(f"{'backend':>12} {'layout':>14} {'image':>18} {'build s':>8} {'seconds':>9} {'PSNR dB':>8} {'vs eager':>9}")
+    for backend in args.backends.split(","):
+        for layout in args.layouts.split(","):
+            # ONNX Runtime picks its own layout, so channels-last would repeat the default row
+            if backend.startswith("onnx") and layout == "channels-last":
+                continue
+            start = time.perf_counter()
+            try:
+                runner = build_backend(copy.deepcopy(model), backend, layout == "channels-last",
+                                       args.threads, calibration)
+            except Exception as e:
+                print(f"{backend:>12} {layout:>14} skipped: {e}")
+                continue
+            build_seconds = time.perf_counter() - start
+
+            for name, reference, inputs in images:
+                # The first call compiles or allocates; time the runs after it
+                tiled_upscale(runner, inputs, args.scale, args.tile, 16)
+                seconds = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    output = tiled_upscale(runner, inputs, args.scale, args.tile, 16)
+                    elapsed = time.perf_counter() - start
+                    seconds = elapsed if seconds is None else min(seconds, elapsed)
+
+                eager_outputs.setdefault(name, output)
+                score = psnr(reference, output)
+                fidelity = psnr(eager_outputs[name], output)
+                results.append({
+                    "backend": backend, "layout": layout, "image": name,
+                    "build_seconds": round(build_seconds, 2), "seconds": round(seconds, 3),
+                    "psnr_db": round(score, 2), "psnr_vs_eager_db": round(fidelity, 2),
+                })
+                print(f"{backend:>12} {layout:>14} {name:>18} {build_seconds:>8.2f} {seconds:>9.3f} "
+                      f"{score:>8.2f} {fidelity:>9.2f}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
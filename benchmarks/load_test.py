@@ -0,0 +1,208 @@
+"""
+Local load test: throughput, latency percentiles and peak memory at increasing concurrency
+
+Starts the FastAPI app (server_ai by default, or main) under uvicorn in a
+child process with the rate limit switched off, waits for it to report
+ready, then for every --concurrency level sends --requests uploads to
+/api/upscale from that many concurrent clients. Every upload differs by one
+pixel, so the result cache never answers for the pipeline. While a level
+runs, the resident memory of the server and its worker processes is sampled,
+and the peak is reported with the level.
+
+Reported per level: completed and failed requests (with status codes, so
+503s from a full worker pool show up), requests per second, p50/p95/p99
+latency and peak RSS. --json writes a file that benchmarks.compare can
+check against another commit's.
+
+Usage (from the repository root):
+    python -m benchmarks.load_test --random-weights
+    python -m benchmarks.load_test --app main --concurrency 1,4,16 --requests 64 --json after.json
+"""
+import argparse
+import asyncio
+import io
+import multiprocessing
+import os
+import socket
+import statistics
+import sys
+import threading
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks.common import REPO_DIR, TEST_IMAGES, patch_random_weights, percentile, tree_rss_mb, write_results
+
+
+def serve(app_module: str, port: int, random_weights: bool):
+    """Child process: run the app with the per-IP rate limit off, since every request comes from localhost"""
+    os.chdir(REPO_DIR)
+    sys.path.insert(0, str(REPO_DIR))
+    if random_weights:
+        patch_random_weights()
+    import importlib
+    import uvicorn
+    module = importlib.import_module(app_module)
+    module.limiter.enabled = False
+    uvicorn.run(module.app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(base_url: str, process, timeout: float):
+    """Wait for the server to answer, then for the readiness probe where the app has one"""
+    deadline = time.monotonic() + timeout
+    for path in ("/metrics", "/api/health/ready"):
+        while True:
+            if not process.is_alive():
+                sys.exit("Server process exited during startup")
+            if time.monotonic() > deadline:
+                sys.exit(f"Server not ready after {timeout:.0f}s")
+            try:
+                status = httpx.get(base_url + path, timeout=5).status_code
+                if status == 200 or (status == 404 and path != "/metrics"):
+                    break
+            except httpx.TransportError:
+                pass
+            time.sleep(0.5)
+
+
+def make_uploads(size: tuple, count: int) -> list:
+    """count PNG uploads of the test image at size, each with one pixel changed so none is a cache hit"""
+    base = Image.open(TEST_IMAGES[0]).convert('RGB').resize(size, Image.LANCZOS)
+    uploads = []
+    for i in range(count):
+        img = base.copy()
+        img.putpixel((i % size[0], (i // size[0]) % size[1]), (i % 256, (i // 256) % 256, 255))
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG", compress_level=1)
+        uploads.append(buffer.getvalue())
+    return uploads
+
+
+class MemorySampler(threading.Thread):
+    """Samples the server's process-tree RSS until stopped, keeping the peak"""
+
+    def __init__(self, pid: int, interval: float = 0.1):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0.0
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, tree_rss_mb(self.pid))
+            self.stopped.wait(self.interval)
+
+    def stop(self) -> float:
+        self.stopped.set()
+        self.join()
+        return self.peak
+
+
+async def run_level(base_url: str, uploads: list, concurrency: int, form: dict) -> tuple:
+    """Send every upload from concurrency clients; returns per-request (seconds, status) and wall time"""
+    pending = list(reversed(uploads))
+    results = []
+
+    async def client(http):
+        while pending:
+            data = pending.pop()
+            start = time.perf_counter()
+            try:
+                response = await http.post(f"{base_url}/api/upscale", data=form,
+                                           files={"file": ("load.png", data, "image/png")})
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            results.append((time.perf_counter() - start, status))
+
+    start = time.perf_counter()
+    async with httpx.AsyncClient(timeout=None) as http:
+        await asyncio.gather(*(client(http) for _ in range(concurrency)))
+    return results, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--app", default="server_ai", choices=["server_ai", "main", "server"])
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=16, help="requests per concurrency level")
+    parser.add_argument("--size", default="640x360")
+    parser.add_argument("--resolution", default="2k")
+    parser.add_argument("--output-format", default="png")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--startup-timeout", type=float, default=600)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = multiprocessing.get_context("spawn").Process(
+        target=serve, args=(args.app, port, args.random_weights), daemon=True
+    )
+    server.start()
+    results = []
+    try:
+        wait_ready(base_url, server, args.startup_timeout)
+        size = tuple(int(v) for v in args.size.split("x"))
+        levels = [int(v) for v in args.concurrency.split(",")]
+        form = {"resolution": args.resolution, "output_format": args.output_format}
+
+        # One request first, so model loading and first-call setup stay out of the levels
+        asyncio.run(run_level(base_url, make_uploads((size[0] + 1, size[1]), 1), 1, form))
+        # Unique across all levels: a later level must not hit results cached by an earlier one
+        uploads = make_uploads(size, args.requests * len(levels))
+
+        print(f"{args.app}: {args.size} -> {args.resolution} {args.output_format}, {args.requests} requests per level")
+        print(f"{'conc':>5} {'ok':>4} {'failed':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+        for i, concurrency in enumerate(levels):
+            sampler = MemorySampler(server.pid)
+            sampler.start()
+            timings, wall = asyncio.run(run_level(
+                base_url, uploads[i * args.requests:(i + 1) * args.requests], concurrency, form
+            ))
+            peak = sampler.stop()
+
+            ok = [seconds * 1000 for seconds, status in timings if status == 200]
+            statuses = {}
+            for _, status in timings:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            row = {
+                "concurrency": concurrency,
+                "requests": len(timings),
+                "ok": len(ok),
+                "failed": len(timings) - len(ok),
+                "statuses": statuses,
+                "throughput_rps": round(len(ok) / wall, 3),
+                "mean_ms": round(statistics.mean(ok), 1) if ok else None,
+                "p50_ms": round(percentile(ok, 50), 1) if ok else None,
+                "p95_ms": round(percentile(ok, 95), 1) if ok else None,
+                "p99_ms": round(percentile(ok, 99), 1) if ok else None,
+                "peak_rss_mb": round(peak, 1),
+            }
+            results.append(row)
+            print(f"{concurrency:>5} {row['ok']:>4} {row['failed']:>6} {row['throughput_rps']:>7} "
+                  f"{row['p50_ms'] or '-':>8} {row['p95_ms'] or '-':>8} {row['p99_ms'] or '-':>8} {row['peak_rss_mb']:>8}")
+            if row["failed"]:
+                print(f"      statuses: {statuses}")
+    finally:
+        server.terminate()
+        server.join()
+
+    if args.json:
+        write_results(
+            args.json, "load_test", ["concurrency"],
+            ["mean_ms", "p50_ms", "p95_ms", "p99_ms", "peak_rss_mb", "failed"], ["throughput_rps"],
+            results, vars(args)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Throughput and tail latency of EDSR with and without micro-batching
+
+N client threads each upscale the same crop repeatedly, either calling the
+model directly (every thread runs its own forward) or through a shared
+BatchScheduler. Reports images/sec and p50/p99 latency per concurrency so a
+batch size and wait time can be picked against a p99 budget.
+
+Usage (from the repository root):
+    python -m benchmarks.micro_batching --random-weights
+    python -m benchmarks.micro_batching --concurrency 1,4,8 --batch-size 8 --wait-ms 5
+"""
+import argparse
+import json
+import threading
+import time
+from pathlib import Path
+
+import torch
+from PIL import Image
+from super_image import ImageLoader
+
+from batching import BatchScheduler
+from benchmarks.common import TEST_IMAGES, load_model, percentile
+
+
+def run_clients(runner, inputs, concurrency: int, requests_per_client: int) -> dict:
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            with torch.no_grad():
+                runner(inputs)
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    return {
+        "images_per_sec": round(len(latencies) / wall, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=4, help="requests per client thread")
+    parser.add_argument("--tile", type=int, default=64, help="side of the square crop each request upscales")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--wait-ms", type=float, default=10)
+    parser.add_argument("--p99-budget-ms", type=float, help="flag runs whose p99 exceeds this")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    model = load_model(args.random_weights)
+    img = Image.open(TEST_IMAGES[0]).convert('RGB').crop((0, 0, args.tile, args.tile))
+    inputs = ImageLoader.load_image(img)
+    scheduler = BatchScheduler(model, args.batch_size, args.wait_ms)
+
+    results = {"batch_size": args.batch_size, "wait_ms": args.wait_ms, "runs": []}
+    print(f"{'clients':>8} {'mode':>8} {'img/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in (int(c) for c in args.concurrency.split(",")):
+        for mode, runner in (("direct", model), ("batched", scheduler)):
+            result = run_clients(runner, inputs, concurrency, args.requests)
+            over = args.p99_budget_ms is not None and result["p99_ms"] > args.p99_budget_ms
+            results["runs"].append({"concurrency": concurrency, "mode": mode, "over_budget": over, **result})
+            flag = "  over p99 budget" if over else ""
+            print(f"{concurrency:>8} {mode:>8} {result['images_per_sec']:>8} {result['p50_ms']:>9} {result['p99_ms']:>9}{flag}")
+
+    results["scheduler"] = scheduler.stats()
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+In-process latency of each upscale pipeline stage over input sizes, presets and modes
+
+Calls the server_ai functions directly, without HTTP or the worker pool:
+validate_image and the decode, smart_resize_to_resolution (its
+ai_upscale_image passes and final Lanczos resize are timed separately
+through StageTimings) and encode_image, for every (size, preset, mode):
+
+    edsr         the AI path as served (tiling, batching and backend from PIXELFORGE_*)
+    lanczos      USE_AI_UPSCALING off
+    edsr-alpha   the AI path on an RGBA input with alpha=keep
+
+Each cell reports the median of --repeat runs after one warm-up run, and
+the peak RSS above the starting point. --json writes a file that
+benchmarks.compare can check against another commit's.
+
+Usage (from the repository root):
+    python -m benchmarks.pipeline --random-weights
+    python -m benchmarks.pipeline --sizes 320x180,640x360 --presets 2k --modes edsr --json before.json
+"""
+import argparse
+import io
+import statistics
+import time
+
+from PIL import Image, ImageDraw
+
+from benchmarks.common import (TEST_IMAGES, current_rss_mb, high_water_rss_mb, patch_random_weights,
+                               reset_peak_rss, write_results)
+
+MODES = ("edsr", "lanczos", "edsr-alpha")
+STAGES = ("decode", "model_load", "inference", "resize", "encode")
+
+
+def source_bytes(size: tuple, alpha: bool) -> bytes:
+    """A test image at size as PNG, with a soft-edged transparent border if alpha"""
+    img = Image.open(TEST_IMAGES[0]).convert('RGB').resize(size, Image.LANCZOS)
+    if alpha:
+        mask = Image.new('L', size, 0)
+        ImageDraw.Draw(mask).ellipse((size[0] // 8, size[1] // 8, size[0] * 7 // 8, size[1] * 7 // 8), fill=255)
+        img.putalpha(mask)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def run_once(server, data: bytes, preset: str, output):
+    """One pass through the pipeline stages; returns the StageTimings and total seconds"""
+    from metrics import StageTimings
+    from transparency import prepare_image
+
+    timings = StageTimings()
+    start = time.perf_counter()
+    with timings.time("decode", preset):
+        img = server.validate_image(data, server.RESOLUTION_PRESETS[preset])
+        img.load()
+        img = prepare_image(img, output.keep_alpha)
+    upscaled = server.smart_resize_to_resolution(img, preset, None, timings)
+    with timings.time("encode", preset):
+        server.encode_image(upscaled, output)
+    return timings, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="320x180,640x360,960x540")
+    parser.add_argument("--presets", default="2k,4k")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    if args.random_weights:
+        patch_random_weights()
+    import server_ai as server
+    from encoding import OutputFormat
+
+    results = []
+    print(f"{'input':>9} {'preset':>6} {'mode':>10} {'engine':>7} "
+          + " ".join(f"{stage:>10}" for stage in STAGES) + f" {'total ms':>9} {'peak MB':>8}")
+    for spec in args.sizes.split(","):
+        size = tuple(int(v) for v in spec.split("x"))
+        for mode in args.modes.split(","):
+            server.USE_AI_UPSCALING = mode != "lanczos"
+            data = source_bytes(size, alpha=mode == "edsr-alpha")
+            output = OutputFormat("png", alpha="keep" if mode == "edsr-alpha" else "flatten")
+            for preset in args.presets.split(","):
+                # The warm-up run absorbs model loading and first-call allocations
+                warmup, _ = run_once(server, data, preset, output)
+                baseline = current_rss_mb()
+                reset_peak_rss()
+                stage_ms = {stage: [] for stage in STAGES}
+                totals = []
+                for _ in range(args.repeat):
+                    timings, total = run_once(server, data, preset, output)
+                    stages = timings.totals()
+                    for stage in STAGES:
+                        stage_ms[stage].append(stages.get(stage, 0.0) * 1000)
+                    totals.append(total * 1000)
+                peak = high_water_rss_mb() - baseline
+
+                row = {
+                    "size": spec, "preset": preset, "mode": mode,
+                    "engine": timings.engines.get(preset),
+                    "model_load_ms": round(warmup.totals().get("model_load", 0.0) * 1000, 1),
+                    **{f"{stage}_ms": round(statistics.median(stage_ms[stage]), 1)
+                       for stage in STAGES if stage != "model_load"},
+                    "total_ms": round(statistics.median(totals), 1),
+                    "peak_rss_mb": round(peak, 1),
+                }
+                results.append(row)
+                print(f"{spec:>9} {preset:>6} {mode:>10} {row['engine']:>7} "
+                      + " ".join(f"{row[f'{stage}_ms']:>10}" for stage in STAGES)
+                      + f" {row['total_ms']:>9} {row['peak_rss_mb']:>8}")
+
+    if args.json:
+        write_results(
+            args.json, "pipeline", ["size", "preset", "mode"],
+            [f"{stage}_ms" for stage in STAGES] + ["total_ms", "peak_rss_mb"], [],
+            results, vars(args)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Speedup of the strip-parallel Lanczos resize over Pillow's, by thread count
+
+For each (source size, output size, mode) the bundled test image is resized
+with Pillow's single-threaded img.resize and with resampling.resize at each
+thread count. Reported per cell: median milliseconds of --repeat runs, the
+speedup over Pillow, and the largest per-channel difference from Pillow's
+output (premultiplied for RGBA), which must stay within --tolerance.
+Threads beyond the machine's cores show the cost of oversubscription.
+
+Usage (from the repository root):
+    python -m benchmarks.resampling
+    python -m benchmarks.resampling --threads 1,2,4,8,16,32 --json before.json
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from PIL import Image, ImageChops
+
+import resampling
+from benchmarks.common import TEST_IMAGES, write_results
+
+
+def source_image(size: tuple, mode: str) -> Image.Image:
+    img = Image.open(TEST_IMAGES[0]).convert("RGB").resize(size, Image.LANCZOS)
+    if mode == "RGBA":
+        img.putalpha(Image.linear_gradient("L").resize(size))
+    return img
+
+
+def median_ms(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def max_difference(expected: Image.Image, actual: Image.Image) -> int:
+    if expected.mode in resampling.PREMULTIPLIED:
+        expected = expected.convert(resampling.PREMULTIPLIED[expected.mode])
+        actual = actual.convert(resampling.PREMULTIPLIED[actual.mode])
+    return max(high for _, high in ImageChops.difference(expected, actual).getextrema())
+
+
+def main():
+    cores = resampling.available_cores()
+    default_threads = sorted({1, cores, *(2 ** i for i in range(1, 6) if 2 ** i < cores)})
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--cases", default="640x360:3840x2160,1280x720:3840x2160,960x540:2560x1440")
+    parser.add_argument("--modes", default="RGB,RGBA")
+    parser.add_argument("--threads", default=",".join(map(str, default_threads)))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--tolerance", type=int, default=1)
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    # Thread counts come from --threads, not PIXELFORGE_RESIZE_THREADS
+    resampling.CONFIGURED_THREADS = 0
+    print(f"{cores} cores available")
+    print(f"{'source':>9} {'output':>9} {'mode':>5} {'threads':>7} {'pillow ms':>10} {'ms':>8} "
+          f"{'speedup':>8} {'max diff':>9}")
+    results = []
+    failed = False
+    for case in args.cases.split(","):
+        source_spec, output_spec = case.split(":")
+        source_size = tuple(int(v) for v in source_spec.split("x"))
+        size = tuple(int(v) for v in output_spec.split("x"))
+        for mode in args.modes.split(","):
+            img = source_image(source_size, mode)
+            expected = img.resize(size, Image.LANCZOS)
+            pillow_ms = median_ms(lambda: img.resize(size, Image.LANCZOS), args.repeat)
+            for threads in (int(t) for t in args.threads.split(",")):
+                resampling.set_resize_threads(threads)
+                # The first call starts the pool's threads
+                difference = max_difference(expected, resampling.resize(img, size))
+                elapsed = median_ms(lambda: resampling.resize(img, size), args.repeat)
+                row = {
+                    "source": source_spec, "output": output_spec, "mode": mode, "threads": threads,
+                    "pillow_ms": round(pillow_ms, 1),
+                    "parallel_ms": round(elapsed, 1),
+                    "speedup": round(pillow_ms / elapsed, 2),
+                    "max_difference": difference,
+                }
+                results.append(row)
+                failed = failed or difference > args.tolerance
+                print(f"{source_spec:>9} {output_spec:>9} {mode:>5} {threads:>7} {row['pillow_ms']:>10} "
+                      f"{row['parallel_ms']:>8} {row['speedup']:>7}x {difference:>9}")
+
+    if args.json:
+        write_results(
+            args.json, "resampling", ["source", "output", "mode", "threads"],
+            ["parallel_ms", "max_difference"], ["speedup"], results, {**vars(args), "cores": cores}
+        )
+    if failed:
+        print(f"Output differs from Pillow's by more than {args.tolerance}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
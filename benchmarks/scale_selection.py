@@ -0,0 +1,79 @@
+"""
+Latency and PSNR of each EDSR scale plan against Lanczos
+
+Each bundled test image is treated as ground truth, downscaled by a factor,
+and brought back to full size with: plain Lanczos, every single native scale
+that reaches the factor (4x is the old always-4x-then-downsample path), and
+the plan select_plan() picks. PSNR is measured against the original.
+
+Usage (from the repository root):
+    python -m benchmarks.scale_selection
+    python -m benchmarks.scale_selection --factors 1.6,2,3,6 --random-weights
+"""
+import argparse
+import json
+import time
+from pathlib import Path
+
+import torch
+from PIL import Image
+from super_image import ImageLoader
+
+from benchmarks.common import TEST_IMAGES, load_model, psnr
+from scale_selection import EDSR_SCALES, candidate_plans, plan_name, select_plan
+from tiled_inference import tiled_upscale
+
+
+def run_plan(models: dict, img: Image.Image, plan: tuple, size: tuple, tile: int) -> Image.Image:
+    for scale in plan:
+        inputs = ImageLoader.load_image(img)
+        img = Image.fromarray(tiled_upscale(models[scale], inputs, scale, tile, 16))
+    return img.resize(size, Image.LANCZOS)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--factors", default="1.6,2,2.5,3,4,6")
+    parser.add_argument("--max-passes", type=int, default=2)
+    parser.add_argument("--tile", type=int, default=192)
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    torch.set_grad_enabled(False)
+    models = {scale: load_model(args.random_weights, scale) for scale in EDSR_SCALES}
+    results = []
+
+    print(f"{'image':>18} {'factor':>7} {'method':>16} {'seconds':>9} {'PSNR dB':>8}")
+    for path in TEST_IMAGES:
+        reference = Image.open(path).convert('RGB')
+        for factor in (float(f) for f in args.factors.split(",")):
+            low_res = reference.resize(
+                (round(reference.width / factor), round(reference.height / factor)), Image.BICUBIC
+            )
+            selected = select_plan(factor, EDSR_SCALES, args.max_passes)
+            # The single 4x plan is the old always-4x-then-downsample path
+            methods = {"lanczos": ()}
+            for plan in candidate_plans(factor, EDSR_SCALES, args.max_passes):
+                if len(plan) == 1 or plan == selected:
+                    label = plan_name(plan) + (" *" if plan == selected else "")
+                    methods[label] = plan
+
+            for label, plan in methods.items():
+                start = time.perf_counter()
+                output = run_plan(models, low_res, plan, reference.size, args.tile)
+                seconds = time.perf_counter() - start
+                score = psnr(reference, output)
+                results.append({
+                    "image": path.name, "factor": factor, "method": label.rstrip(" *"),
+                    "selected": plan == selected, "seconds": round(seconds, 3), "psnr_db": round(score, 2),
+                })
+                print(f"{path.name:>18} {factor:>7} {label:>16} {seconds:>9.3f} {score:>8.2f}")
+
+    print("* = plan chosen by select_plan()")
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
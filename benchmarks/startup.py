@@ -0,0 +1,113 @@
+"""
+Cold-start cost of the server under each engine: import time, memory and time to ready
+
+Every run is a fresh interpreter started with PIXELFORGE_ENGINE set, which
+imports server_ai (and with it whatever the engine needs), then loads the
+engine's models and warms them up as the server's startup does. Reported
+per engine, as the median of --repeat runs:
+
+    import_ms / import_rss_mb   importing server_ai, and the RSS once imported
+    modules                     modules the import added to sys.modules
+    torch                       whether PyTorch was imported
+    load_ms / warmup_ms         ENGINE.load() and ENGINE.warmup() after it
+    ready_ms / ready_rss_mb     from spawning the interpreter to ready, and the RSS then
+
+--json writes a file that benchmarks.compare can check against another
+commit's.
+
+Usage (from the repository root):
+    python -m benchmarks.startup --random-weights
+    python -m benchmarks.startup --engines lanczos,edsr --repeat 5 --json before.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Only the standard library is imported here: the child runs import this module first
+METRICS = ("import_ms", "import_rss_mb", "modules", "load_ms", "warmup_ms", "ready_ms", "ready_rss_mb")
+
+
+def _rss_mb() -> float:
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+
+
+def child(random_weights: bool, started: float):
+    """Runs in the fresh interpreter: import, load and warm up, then print one result line"""
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    import server_ai
+    import_s = time.perf_counter() - start
+    result = {
+        "import_ms": import_s * 1000,
+        "import_rss_mb": _rss_mb(),
+        "modules": len(sys.modules) - modules,
+        "torch": "torch" in sys.modules,
+    }
+
+    if random_weights and server_ai.ENGINE.scales:
+        from benchmarks.common import patch_random_weights
+        patch_random_weights()
+    start = time.perf_counter()
+    server_ai.ENGINE.load()
+    result["load_ms"] = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    server_ai.ENGINE.warmup()
+    result["warmup_ms"] = (time.perf_counter() - start) * 1000
+    result["ready_ms"] = (time.time() - started) * 1000
+    result["ready_rss_mb"] = _rss_mb()
+    print("RESULT " + json.dumps(result))
+
+
+def run_child(engine: str, random_weights: bool) -> dict:
+    """One cold start of the server with the given engine, in a new interpreter"""
+    from benchmarks.common import REPO_DIR
+
+    code = f"from benchmarks.startup import child; child({random_weights!r}, {time.time()!r})"
+    env = {**os.environ, "PIXELFORGE_ENGINE": engine, "PIXELFORGE_JOB_DIR": os.environ.get(
+        "PIXELFORGE_JOB_DIR", os.path.join(os.environ.get("TMPDIR", "/tmp"), "pixelforge-startup-jobs"))}
+    proc = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, env=env, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith("RESULT "):
+            return json.loads(line[len("RESULT "):])
+    raise RuntimeError(f"{engine} run failed:\n{proc.stdout[-2000:]}{proc.stderr[-2000:]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--engines", default="lanczos,edsr")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    from benchmarks.common import write_results
+
+    results = []
+    print(f"{'engine':>8} {'import ms':>10} {'import MB':>10} {'modules':>8} {'torch':>6} "
+          f"{'load ms':>9} {'warmup ms':>10} {'ready ms':>9} {'ready MB':>9}")
+    for engine in args.engines.split(","):
+        runs = [run_child(engine, args.random_weights) for _ in range(args.repeat)]
+        row = {
+            "engine": engine,
+            **{metric: round(statistics.median(run[metric] for run in runs), 1) for metric in METRICS},
+            "torch": runs[0]["torch"],
+        }
+        results.append(row)
+        print(f"{engine:>8} {row['import_ms']:>10} {row['import_rss_mb']:>10} {row['modules']:>8} "
+              f"{str(row['torch']):>6} {row['load_ms']:>9} {row['warmup_ms']:>10} {row['ready_ms']:>9} "
+              f"{row['ready_rss_mb']:>9}")
+
+    if args.json:
+        write_results(
+            args.json, "startup", ["engine"], list(METRICS), [], results, vars(args)
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Peak memory and latency of tiled vs untiled EDSR inference
+
+Each (input size, mode) run happens in a fresh process so ru_maxrss reflects
+only that run. A small crop is also upscaled both ways to check that the
+tiled output matches the untiled output within tolerance.
+
+Usage (from the repository root):
+    python -m benchmarks.tiled_inference
+    python -m benchmarks.tiled_inference --sizes 640x360,1920x1080 --tile 128
+    python -m benchmarks.tiled_inference --random-weights   # offline, untrained EDSR
+"""
+import argparse
+import json
+import multiprocessing
+import time
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from benchmarks.common import TEST_IMAGES, current_rss_mb, load_model, peak_rss_mb
+
+SOURCE_IMAGE = TEST_IMAGES[1]
+
+
+def upscale(model, img: Image.Image, tile_size: int, overlap: int) -> np.ndarray:
+    import torch
+    from conversion import image_to_tensor, tensor_to_array
+    from tiled_inference import tiled_upscale
+
+    inputs = image_to_tensor(img)
+    if tile_size:
+        return tiled_upscale(model, inputs, 4, tile_size, overlap)
+    with torch.no_grad():
+        return tensor_to_array(model(inputs)[0])
+
+
+def run_one(size, tile_size, overlap, random_weights, queue):
+    """Child process: load the model, upscale one image and report peak RSS"""
+    import torch
+    torch.set_grad_enabled(False)
+    model = load_model(random_weights)
+    img = Image.open(SOURCE_IMAGE).convert('RGB').resize(size, Image.LANCZOS)
+    baseline = current_rss_mb()
+    start = time.perf_counter()
+    upscale(model, img, tile_size, overlap)
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    queue.put({"seconds": round(seconds, 3), "baseline_rss_mb": round(baseline, 1), "peak_rss_mb": round(peak, 1)})
+
+
+def measure(ctx, size, tile_size, overlap, random_weights) -> dict:
+    queue = ctx.Queue()
+    proc = ctx.Process(target=run_one, args=(size, tile_size, overlap, random_weights, queue))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        return {"error": f"exit code {proc.exitcode} (likely out of memory)"}
+    return queue.get()
+
+
+def check_equivalence(tile_size: int, overlap: int, random_weights: bool) -> dict:
+    """Compare tiled and untiled output on an input a few tiles across"""
+    model = load_model(random_weights)
+    side = tile_size * 2 + overlap
+    img = Image.open(SOURCE_IMAGE).convert('RGB').crop((0, 0, side, side))
+    untiled = upscale(model, img, 0, overlap).astype(np.float64)
+    tiled = upscale(model, img, tile_size, overlap).astype(np.float64)
+    diff = np.abs(untiled - tiled)
+    mse = float((diff ** 2).mean())
+    psnr = float("inf") if mse == 0 else float(10 * np.log10(255 ** 2 / mse))
+    return {"input": f"{side}x{side}", "max_abs_diff": float(diff.max()), "mean_abs_diff": round(float(diff.mean()), 4), "psnr_db": round(psnr, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="320x180,640x360,1280x720,1920x1080")
+    parser.add_argument("--tile", type=int, default=192)
+    parser.add_argument("--overlap", type=int, default=16)
+    parser.add_argument("--untiled-max-pixels", type=int, default=1280 * 720,
+                        help="skip untiled runs above this many input pixels")
+    parser.add_argument("--random-weights", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    args = parser.parse_args()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = {"tile": args.tile, "overlap": args.overlap, "runs": []}
+
+    print(f"{'input':>10} {'mode':>8} {'seconds':>9} {'base MB':>9} {'peak MB':>9}")
+    for spec in args.sizes.split(","):
+        size = tuple(int(v) for v in spec.split("x"))
+        modes = [("tiled", args.tile)]
+        if size[0] * size[1] <= args.untiled_max_pixels:
+            modes.append(("untiled", 0))
+        for mode, tile_size in modes:
+            result = measure(ctx, size, tile_size, args.overlap, args.random_weights)
+            results["runs"].append({"input": spec, "mode": mode, **result})
+            if "error" in result:
+                print(f"{spec:>10} {mode:>8} {result['error']}")
+            else:
+                print(f"{spec:>10} {mode:>8} {result['seconds']:>9} {result['baseline_rss_mb']:>9} {result['peak_rss_mb']:>9}")
+
+    results["equivalence"] = check_equivalence(args.tile, args.overlap, args.random_weights)
+    print(f"Tiled vs untiled: {results['equivalence']}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Copy-light conversions between PIL images, NumPy arrays and model tensors
+
+super_image's ImageLoader.load_image makes four full-size float32 copies of
+the input on its way to a tensor. On the way back, scaling, clamping, the
+uint8 cast and the contiguous copy Image.fromarray needs each made another
+copy of the (4x larger) output. Here the input pixels are cast and scaled
+straight into a float buffer that torch.from_numpy wraps without copying.
+Outputs are scaled, clamped and rounded in place, then cast straight into
+an HWC uint8 array. Each direction costs one copy at its final dtype.
+
+BufferPool keeps those buffers per thread and reuses them across requests,
+so a steady stream of similar-sized images stops reallocating them.
+"""
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+from transparency import ALPHA_RESAMPLE
+
+
+class BufferPool:
+    """
+    Scratch arrays reused across calls, one set per thread
+    An array returned by get() is only valid until the same thread asks for
+    the same name again. Buffers that would take the thread's total over
+    max_bytes are allocated fresh and not kept
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _buffers(self) -> dict:
+        if not hasattr(self._local, "buffers"):
+            self._local.buffers = {}
+        return self._local.buffers
+
+    def get(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        """An uninitialised C-contiguous array of the given shape and dtype"""
+        buffers = self._buffers()
+        dtype = np.dtype(dtype)
+        size = int(np.prod(shape))
+        buffer = buffers.get(name)
+        if buffer is None or buffer.dtype != dtype or buffer.size < size:
+            buffer = np.empty(size, dtype)
+            kept = sum(b.nbytes for key, b in buffers.items() if key != name)
+            if kept + buffer.nbytes <= self.max_bytes:
+                buffers[name] = buffer
+        return buffer[:size].reshape(shape)
+
+    def nbytes(self) -> int:
+        """Bytes held for the calling thread"""
+        return sum(b.nbytes for b in self._buffers().values())
+
+
+def image_to_tensor(img: Image.Image, pool: BufferPool = None) -> torch.Tensor:
+    """
+    (1, 3, H, W) float32 tensor in [0, 1] from an RGB image, matching ImageLoader.load_image
+    The alpha channel of an RGBA image is left out
+    """
+    # np.asarray takes PIL's one unavoidable copy; the slice and transpose below are views
+    pixels = np.asarray(img)[..., :3]
+    height, width, _ = pixels.shape
+    shape = (1, 3, height, width)
+    out = pool.get("input", shape, np.float32) if pool is not None else np.empty(shape, np.float32)
+    np.divide(pixels.transpose(2, 0, 1), np.float32(255), out=out[0], dtype=np.float32)
+    return torch.from_numpy(out)
+
+
+def tensor_to_array(tensor: torch.Tensor, out: np.ndarray = None) -> np.ndarray:
+    """
+    (H, W, C) uint8 array from a (C, H, W) float tensor in [0, 1]
+    out may be a strided view, e.g. the colour channels of an RGBA array
+    The tensor is scaled in place, so only pass outputs that are not used afterwards
+    """
+    channels, height, width = tensor.shape
+    if out is None:
+        out = np.empty((height, width, channels), np.uint8)
+    tensor.mul_(255).clamp_(0, 255).round_()
+    # Cast through a CHW view of the HWC array, without an intermediate uint8 tensor
+    torch.from_numpy(out).permute(2, 0, 1).copy_(tensor)
+    return out
+
+
+def array_to_image(array: np.ndarray) -> Image.Image:
+    """RGB or RGBA image holding its own copy of an (H, W, 3 or 4) uint8 array, so the array may be reused"""
+    height, width, channels = array.shape
+    return Image.frombytes("RGBA" if channels == 4 else "RGB", (width, height), np.ascontiguousarray(array))
+
+
+def resize_alpha_into(alpha: Image.Image, out: np.ndarray):
+    """Resize an alpha band to fit an (H, W, 4) uint8 array and write it into the array's last channel"""
+    height, width, _ = out.shape
+    if alpha.size != (width, height):
+        alpha = alpha.resize((width, height), ALPHA_RESAMPLE)
+    out[..., 3] = np.asarray(alpha)
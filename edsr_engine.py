@@ -0,0 +1,221 @@
+"""
+EDSR super-resolution engine
+
+Everything that needs PyTorch, super_image and NumPy is imported here, and
+engines.py only imports this module when PIXELFORGE_ENGINE is edsr. One
+model is loaded per native scale; inference runs tile by tile (see
+tiled_inference.py), shares forwards across concurrent requests through a
+BatchScheduler, and can use the CPU backends in inference_backends.py.
+"""
+import glob
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import torch
+from PIL import Image
+from super_image import EdsrModel
+
+from batching import BatchScheduler
+from conversion import BufferPool, array_to_image, image_to_tensor, resize_alpha_into, tensor_to_array
+from engines import Engine, lanczos_upscale
+from inference_backends import build_backend, calibration_tiles
+from scale_selection import EDSR_SCALES
+from tiled_inference import tiled_upscale
+from transparency import prepare_image
+
+# Native model scales to load and plan passes over
+AI_SCALES = tuple(int(s) for s in os.environ.get("PIXELFORGE_EDSR_SCALES", ",".join(map(str, EDSR_SCALES))).split(","))
+
+# Tiled inference keeps EDSR memory bounded on large inputs (0 disables tiling)
+AI_TILE_SIZE = int(os.environ.get("PIXELFORGE_TILE_SIZE", 192))
+AI_TILE_OVERLAP = int(os.environ.get("PIXELFORGE_TILE_OVERLAP", 16))
+
+# Micro-batching of tiles across concurrent requests (batch size 1 disables it)
+AI_BATCH_SIZE = int(os.environ.get("PIXELFORGE_BATCH_SIZE", 4))
+AI_BATCH_WAIT_MS = float(os.environ.get("PIXELFORGE_BATCH_WAIT_MS", 10))
+
+# CPU inference backend (see inference_backends.py), NHWC layout and intra-op threads
+AI_BACKEND = os.environ.get("PIXELFORGE_BACKEND", "eager")
+AI_CHANNELS_LAST = os.environ.get("PIXELFORGE_CHANNELS_LAST", "0") == "1"
+AI_TORCH_THREADS = int(os.environ.get("PIXELFORGE_TORCH_THREADS", 0))  # 0 keeps PyTorch's default
+AI_CALIBRATION_IMAGES = os.environ.get(
+    "PIXELFORGE_CALIBRATION_IMAGES", str(Path(__file__).resolve().parent / "test_*.jpg")
+)
+if AI_TORCH_THREADS:
+    torch.set_num_threads(AI_TORCH_THREADS)
+
+# Per-thread input and output buffers for tensor conversion, reused across requests
+CONVERSION_BUFFERS = BufferPool(max_bytes=int(os.environ.get("PIXELFORGE_CONVERSION_BUFFER_MB", 256)) * 1024 * 1024)
+
+
+class EdsrEngine(Engine):
+    """EDSR (Enhanced Deep Super-Resolution), pre-trained on DIV2K, one model per native scale"""
+
+    name = "EDSR"
+
+    def __init__(self):
+        super().__init__()
+        self.scales = AI_SCALES
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        # ONNX Runtime sessions and torch.compile hold threads of their own, and CUDA cannot be forked
+        self.forkable = self.device == 'cpu' and AI_BACKEND not in ("onnx", "onnx-int8", "compile")
+        self.threads = AI_TORCH_THREADS
+        self.models = {}  # Native scale -> EDSR model, loaded once under _lock
+        self.batchers = {}  # One scheduler per loaded model
+        self._lock = threading.Lock()
+
+    def model(self, scale: int = 4):
+        """
+        Return the model for a native scale, loading it on first use
+        The lock makes concurrent first requests wait for one load instead of racing
+        """
+        if scale in self.models:
+            return self.models[scale]
+        with self._lock:
+            if scale in self.models:
+                return self.models[scale]
+            try:
+                start = time.perf_counter()
+                print(f"Loading EDSR AI model ({scale}x) for super-resolution...")
+                # Load EDSR model for this scale (pre-trained on DIV2K dataset)
+                model = EdsrModel.from_pretrained('eugenesiow/edsr-base', scale=scale)
+                model = model.to(self.device)
+                model.eval()
+                # Swap in the configured CPU backend, staying on eager if it cannot be built
+                if self.device == 'cpu' and (AI_BACKEND != "eager" or AI_CHANNELS_LAST):
+                    try:
+                        calibration = None
+                        if AI_BACKEND == "int8":
+                            calibration = calibration_tiles(sorted(glob.glob(AI_CALIBRATION_IMAGES)))
+                        model = build_backend(model, AI_BACKEND, AI_CHANNELS_LAST, self.threads or None, calibration)
+                        print(f"Using {AI_BACKEND} inference backend{' (channels-last)' if AI_CHANNELS_LAST else ''}")
+                    except Exception as e:
+                        print(f"Inference backend {AI_BACKEND} unavailable ({e}), using eager PyTorch")
+                self.models[scale] = model
+                self.load_seconds[f"{scale}x"] = time.perf_counter() - start
+                print(f"AI model ({scale}x) loaded successfully on {self.device}")
+            except Exception as e:
+                print(f"Failed to load AI model ({scale}x): {e}")
+                print("Falling back to high-quality interpolation")
+        return self.models.get(scale)
+
+    def batcher(self, scale: int):
+        """
+        The micro-batching scheduler for a loaded model, or None when batching is off
+        Made on first use rather than at load, as its thread would not survive a fork
+        """
+        if AI_BATCH_SIZE <= 1 or scale not in self.models:
+            return None
+        if scale not in self.batchers:
+            with self._lock:
+                if scale not in self.batchers:
+                    self.batchers[scale] = BatchScheduler(self.models[scale], AI_BATCH_SIZE, AI_BATCH_WAIT_MS)
+        return self.batchers[scale]
+
+    def load(self):
+        for scale in self.scales:
+            self.model(scale)
+
+    def preload(self):
+        """
+        Load in a master process about to fork, on one thread so that no
+        OpenMP thread team exists at fork time
+        """
+        if self.forkable:
+            torch.set_num_threads(1)
+            self.load()
+
+    def warmup(self):
+        """
+        Load every model and run forwards at the tile sizes inference will use,
+        so the first request pays neither the weight load nor the first-forward
+        allocator and kernel setup
+        """
+        tile = AI_TILE_SIZE or 64
+        batch_sizes = {1, AI_BATCH_SIZE} if AI_BATCH_SIZE > 1 else {1}
+        for scale in self.scales:
+            model = self.model(scale)
+            if model is None:
+                continue
+            with torch.no_grad():
+                for batch_size in sorted(batch_sizes):
+                    model(torch.zeros(batch_size, 3, tile, tile, device=self.device))
+
+    def loaded(self) -> list:
+        return [f"{scale}x" for scale in sorted(self.models)]
+
+    def set_threads(self, threads: int):
+        """Intra-op threads for PyTorch (and ONNX Runtime), unless PIXELFORGE_TORCH_THREADS fixes them"""
+        self.threads = AI_TORCH_THREADS or threads
+        torch.set_num_threads(self.threads)
+
+    def upscale(self, img: Image.Image, scale_factor: int = 4, timings=None, resolution: str = "") -> Image.Image:
+        """
+        AI-powered image upscaling using EDSR (Enhanced Deep Super-Resolution)
+        This uses a real deep learning model trained on high-quality image datasets
+        Stage times go into timings under resolution; a Lanczos fallback marks
+        that resolution's engine as Lanczos
+        """
+        try:
+            start = time.perf_counter()
+            loaded = scale_factor in self.models
+            model = self.model(scale_factor)
+            if not loaded:
+                timings.add("model_load", time.perf_counter() - start, resolution, self.name)
+            if model is None:
+                raise Exception("AI model not available")
+            start = time.perf_counter()
+
+            # EDSR expects RGB images; an RGBA image keeps its alpha aside
+            img = prepare_image(img, keep_alpha=img.mode == 'RGBA')
+            alpha = img.getchannel('A') if img.mode == 'RGBA' else None
+
+            # Prepare the colour channels for the model in this thread's reusable input buffer
+            inputs = image_to_tensor(img, CONVERSION_BUFFERS).to(self.device)
+
+            # Share forward passes with concurrent requests when batching is enabled
+            batcher = self.batcher(scale_factor)
+            runner = batcher if batcher is not None else model
+
+            # Run AI upscaling, tile by tile for inputs larger than one tile
+            output_shape = (img.height * scale_factor, img.width * scale_factor, 3 if alpha is None else 4)
+            output_img = CONVERSION_BUFFERS.get("output", output_shape, np.uint8)
+            rgb_out = output_img[..., :3]
+            if AI_TILE_SIZE and max(img.size) > AI_TILE_SIZE:
+                batch_size = AI_BATCH_SIZE if batcher is not None else 1
+                tiled_upscale(runner, inputs, scale_factor, AI_TILE_SIZE, AI_TILE_OVERLAP, batch_size, out=rgb_out)
+            else:
+                with torch.no_grad():
+                    outputs = runner(inputs)
+                tensor_to_array(outputs[0], rgb_out)
+
+            # Alpha is a smooth mask, so a cheap resampler fills the fourth channel
+            if alpha is not None:
+                resize_alpha_into(alpha, output_img)
+
+            # Copy the array into a PIL Image, freeing the buffer for the next request
+            upscaled_img = array_to_image(output_img)
+            timings.add("inference", time.perf_counter() - start, resolution, self.name)
+
+            return upscaled_img
+
+        except Exception as e:
+            print(f"AI upscaling failed: {e}")
+            # Fallback to high-quality interpolation
+            timings.engines[resolution] = "Lanczos"
+            return lanczos_upscale(img, scale_factor, timings, resolution)
+
+    def info(self) -> dict:
+        return {
+            "engine": self.name,
+            "ai_model": "EDSR (Enhanced Deep Super-Resolution)",
+            "ai_scales": list(self.scales),
+            "inference_backend": AI_BACKEND,
+            "device": self.device
+        }
+
+    def stats(self) -> dict:
+        return {"batching": {f"{scale}x": batcher.stats() for scale, batcher in self.batchers.items()}}
@@ -0,0 +1,108 @@
+"""
+Output encoding modes for upscaled images
+
+PNG with optimize=True spends seconds of single-threaded zlib work on a 4K
+frame, often more than the upscale itself. Each request can instead choose
+its format and effort:
+
+    png            lossless, quality = zlib level 0-9 (optimize off)
+    webp           lossy, quality 0-100
+    webp-lossless  lossless, quality = encoder effort 0-100
+    jpeg           lossy, quality 1-95
+    auto           WebP if the client's Accept header lists it, else PNG
+
+Transparent uploads are flattened onto white unless alpha="keep" is asked
+for, in which case PNG and WebP output stays RGBA (see transparency.py).
+JPEG cannot carry alpha and is always flattened.
+"""
+import io
+import os
+
+from fastapi import HTTPException
+from PIL import Image
+
+from transparency import flatten, has_alpha
+
+DEFAULT_PNG_LEVEL = int(os.environ.get("PIXELFORGE_PNG_LEVEL", 6))
+
+# format name -> (PIL format, media type, file extension, quality range, default quality)
+OUTPUT_FORMATS = {
+    "png": ("PNG", "image/png", "png", (0, 9), DEFAULT_PNG_LEVEL),
+    "webp": ("WEBP", "image/webp", "webp", (0, 100), 90),
+    "webp-lossless": ("WEBP", "image/webp", "webp", (0, 100), 25),
+    "jpeg": ("JPEG", "image/jpeg", "jpg", (1, 95), 90),
+}
+
+ALPHA_MODES = ("flatten", "keep")
+
+
+class OutputFormat:
+    """A resolved output format, quality and alpha mode, ready to encode with"""
+
+    def __init__(self, name: str, quality: int = None, alpha: str = "flatten"):
+        self.name = name
+        self.pil_format, self.media_type, self.extension, _, default_quality = OUTPUT_FORMATS[name]
+        self.quality = default_quality if quality is None else quality
+        self.alpha = alpha
+
+    @property
+    def keep_alpha(self) -> bool:
+        """Whether transparency survives into this output"""
+        return self.alpha == "keep" and self.pil_format != "JPEG"
+
+    @property
+    def cache_tag(self) -> str:
+        """Identifies this output in result cache keys"""
+        tag = f"{self.name}:{self.quality}"
+        return f"{tag}:alpha" if self.keep_alpha else tag
+
+    def save_options(self) -> dict:
+        if self.name == "png":
+            return {"compress_level": self.quality, "optimize": False}
+        if self.name == "webp":
+            return {"quality": self.quality, "method": 4}
+        if self.name == "webp-lossless":
+            return {"lossless": True, "quality": self.quality, "method": 0 if self.quality < 50 else 4}
+        return {"quality": self.quality, "subsampling": 0 if self.quality >= 90 else 2}
+
+
+def resolve_output_format(output_format: str = "png", quality: int = None, accept: str = "",
+                          alpha: str = "flatten") -> OutputFormat:
+    """Validate the requested output format, quality and alpha mode, negotiating "auto" against Accept"""
+    output_format = (output_format or "png").lower()
+    if output_format == "auto":
+        output_format = "webp" if "image/webp" in (accept or "") else "png"
+    if output_format not in OUTPUT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid output format. Choose from: {', '.join([*OUTPUT_FORMATS, 'auto']).upper()}"
+        )
+    if quality is not None:
+        low, high = OUTPUT_FORMATS[output_format][3]
+        if not low <= quality <= high:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Invalid quality for {output_format.upper()}. Choose from {low} to {high}"
+            )
+    alpha = (alpha or "flatten").lower()
+    if alpha not in ALPHA_MODES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid alpha mode. Choose from: {', '.join(ALPHA_MODES).upper()}"
+        )
+    return OutputFormat(output_format, quality, alpha)
+
+
+def encode_image(img: Image.Image, output: OutputFormat, fp=None):
+    """
+    Encode an image with the chosen format and options
+    Returns the bytes, or writes them to fp (e.g. a ChunkPipe) and returns None
+    """
+    if output.pil_format == "JPEG" and img.mode not in ("RGB", "L"):
+        img = flatten(img) if has_alpha(img) else img.convert("RGB")
+    if fp is not None:
+        img.save(fp, format=output.pil_format, **output.save_options())
+        return None
+    output_buffer = io.BytesIO()
+    img.save(output_buffer, format=output.pil_format, **output.save_options())
+    return output_buffer.getvalue()
@@ -0,0 +1,96 @@
+"""
+Upscaling engines and the registry the server picks one from
+
+An engine enlarges an image by one of its native scale factors per pass;
+the server plans the passes (see scale_selection.py) and resizes the result
+to the exact preset. PIXELFORGE_ENGINE chooses the engine at startup:
+
+    lanczos   Pillow's Lanczos resampling: no model and no extra dependencies
+    edsr      EDSR super-resolution (edsr_engine.py; needs torch and super_image)
+
+Engines are registered as "module:Class" strings and only imported when
+chosen, so a Lanczos server never imports PyTorch and starts in a fraction
+of the time. Another model is added with register_engine("name",
+"module:Class"), with a class that follows Engine.
+"""
+import importlib
+import os
+
+from PIL import Image
+
+from resampling import resize
+
+ENGINES = {
+    "lanczos": "engines:Engine",
+    "edsr": "edsr_engine:EdsrEngine",
+}
+
+
+def register_engine(name: str, target: str):
+    """Make an engine class, given as "module:Class", available as PIXELFORGE_ENGINE=name"""
+    ENGINES[name.lower()] = target
+
+
+def create_engine(name: str) -> "Engine":
+    """Import the named engine's module, and with it its dependencies, and build the engine"""
+    if name.lower() not in ENGINES:
+        raise ValueError(f"Unknown engine: {name}. Choose from: {', '.join(ENGINES)}")
+    module_name, class_name = ENGINES[name.lower()].split(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+
+def engine_from_env(default: str = "edsr") -> "Engine":
+    """Build the engine named by PIXELFORGE_ENGINE"""
+    return create_engine(os.environ.get("PIXELFORGE_ENGINE", default))
+
+
+def lanczos_upscale(img: Image.Image, scale: int, timings, resolution: str = "") -> Image.Image:
+    """A Lanczos pass at scale, timed as a Lanczos resize; also the model engines' fallback"""
+    with timings.time("resize", resolution, "Lanczos"):
+        return resize(img, (img.width * scale, img.height * scale))
+
+
+class Engine:
+    """
+    The Lanczos engine, and the interface model engines override
+    With no native scales, the server reaches every preset in one resize
+    """
+
+    name = "Lanczos"  # reported in X-AI-Upscaling, cache keys and metrics
+    scales = ()  # native scale factors a pass can apply
+    device = "cpu"
+    forkable = True  # whether load() may run in a master process before workers are forked
+
+    def __init__(self):
+        self.load_seconds = {}  # model -> seconds it took to load
+
+    def load(self):
+        """Load every model, so that requests (or forked workers) find them ready"""
+
+    def preload(self):
+        """Load in a master process before workers are forked from it, when that is safe"""
+        if self.forkable:
+            self.load()
+
+    def warmup(self):
+        """Load, then run a first inference at the sizes requests will use"""
+        self.load()
+
+    def loaded(self) -> list:
+        """Names of the loaded models"""
+        return []
+
+    def set_threads(self, threads: int):
+        """Intra-op threads for inference"""
+
+    def upscale(self, img: Image.Image, scale: int, timings, resolution: str = "") -> Image.Image:
+        """One pass at a native scale; stage times go into timings under resolution"""
+        return lanczos_upscale(img, scale, timings, resolution)
+
+    def info(self) -> dict:
+        """Engine details for /api/info"""
+        return {"engine": self.name, "device": self.device}
+
+    def stats(self) -> dict:
+        """Engine counters for /api/stats"""
+        return {}
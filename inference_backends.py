@@ -0,0 +1,131 @@
+"""
+Selectable CPU inference backends for the EDSR models
+
+Every backend is a callable taking an (N, 3, H, W) float tensor in [0, 1]
+and returning the upscaled tensor, so tiled_upscale and BatchScheduler use
+any of them in place of the eager module:
+
+    eager        the PyTorch module as loaded
+    torchscript  traced and frozen TorchScript graph
+    compile      torch.compile with dynamic shapes (slow first call, so warm up)
+    onnx         exported to ONNX and run in ONNX Runtime
+    onnx-int8    the ONNX export with dynamically quantized int8 weights
+    int8         PyTorch FX static int8 quantization, calibrated on sample tiles
+
+channels_last converts the model weights and inputs to NHWC, the layout that
+oneDNN convolutions prefer on CPU. The ONNX backends need the optional
+onnx and onnxruntime packages.
+"""
+import copy
+import os
+import tempfile
+
+import numpy as np
+import torch
+from PIL import Image
+
+BACKENDS = ("eager", "torchscript", "compile", "onnx", "onnx-int8", "int8")
+
+
+class ChannelsLast:
+    """Runs a channels-last model on inputs converted to the same layout"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        return self.model(inputs.contiguous(memory_format=torch.channels_last))
+
+
+class OnnxRuntimeModel:
+    """Runs an exported ONNX model in an ONNX Runtime CPU session"""
+
+    def __init__(self, path: str, threads: int = None):
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, inputs: torch.Tensor) -> torch.Tensor:
+        array = np.ascontiguousarray(inputs.cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {"input": array})[0])
+
+
+def export_onnx(model, path: str, example: torch.Tensor):
+    """Export with dynamic batch and spatial axes, so any tile shape can be run"""
+    with torch.no_grad():
+        torch.onnx.export(
+            model, example, path, input_names=["input"], output_names=["output"], opset_version=17,
+            dynamic_axes={"input": {0: "batch", 2: "height", 3: "width"},
+                          "output": {0: "batch", 2: "out_height", 3: "out_width"}},
+            dynamo=False,
+        )
+
+
+def quantize_static(model, calibration: list):
+    """FX graph-mode int8 quantization, with activation ranges observed on calibration tensors"""
+    from torch.ao.quantization import get_default_qconfig_mapping
+    from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+    engine = "x86" if "x86" in torch.backends.quantized.supported_engines else "qnnpack"
+    torch.backends.quantized.engine = engine
+    prepared = prepare_fx(copy.deepcopy(model).eval(), get_default_qconfig_mapping(engine), (calibration[0],))
+    with torch.no_grad():
+        for inputs in calibration:
+            prepared(inputs)
+    return convert_fx(prepared)
+
+
+def calibration_tiles(paths: list, tile_size: int = 64, max_tiles: int = 16) -> list:
+    """(1, 3, tile, tile) tensors cut from sample images, or noise if none can be read"""
+    tiles = []
+    for path in paths:
+        try:
+            img = np.asarray(Image.open(path).convert("RGB"), dtype=np.float32) / 255
+        except OSError:
+            continue
+        height, width, _ = img.shape
+        for y in range(0, height - tile_size + 1, tile_size * 2):
+            for x in range(0, width - tile_size + 1, tile_size * 2):
+                tile = img[y:y + tile_size, x:x + tile_size]
+                tiles.append(torch.from_numpy(np.ascontiguousarray(tile.transpose(2, 0, 1)))[None])
+    if not tiles:
+        print("No calibration images found, calibrating int8 on random tiles")
+        tiles = [torch.rand(1, 3, tile_size, tile_size) for _ in range(max_tiles)]
+    step = max(1, len(tiles) // max_tiles)
+    return tiles[::step][:max_tiles]
+
+
+def build_backend(model, name: str = "eager", channels_last: bool = False, threads: int = None,
+                  calibration: list = None, tile_size: int = 64):
+    """
+    Wrap an eval-mode EDSR module in the named backend
+    calibration (see calibration_tiles) is only used by int8
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {name}. Choose from: {', '.join(BACKENDS)}")
+    example = torch.rand(1, 3, tile_size, tile_size)
+
+    if name in ("onnx", "onnx-int8"):
+        # The session reads the whole model when created, so the export can go after it
+        with tempfile.TemporaryDirectory(prefix="pixelforge-onnx-") as export_dir:
+            path = os.path.join(export_dir, "model.onnx")
+            export_onnx(model, path, example)
+            if name == "onnx-int8":
+                from onnxruntime.quantization import QuantType, quantize_dynamic
+                quantized_path = os.path.join(export_dir, "model-int8.onnx")
+                quantize_dynamic(path, quantized_path, weight_type=QuantType.QUInt8)
+                path = quantized_path
+            return OnnxRuntimeModel(path, threads)
+
+    if name == "int8":
+        model = quantize_static(model, calibration or calibration_tiles([], tile_size))
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+        example = example.contiguous(memory_format=torch.channels_last)
+    if name == "torchscript":
+        with torch.no_grad():
+            model = torch.jit.freeze(torch.jit.trace(model, example, check_trace=False))
+    elif name == "compile":
+        model = torch.compile(model, dynamic=True)
+    return ChannelsLast(model) if channels_last else model
@@ -0,0 +1,241 @@
+"""
+Persistent queue for long-running upscale jobs
+
+A 4K EDSR run on CPU takes tens of seconds, longer than many proxies keep a
+request open. Clients can instead submit a job, get its id back at once, and
+poll its status (or follow it as server-sent events) before downloading the
+result. Job rows live in a SQLite database and uploads and results are plain
+files next to it, so the queue needs no external broker and survives a
+restart: jobs that were running when the process died are queued again.
+
+Worker threads claim queued jobs oldest first with a conditional UPDATE, so
+several server processes may share one job directory.
+"""
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from worker_pool import PoolFullError
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    stage TEXT,
+    progress REAL NOT NULL DEFAULT 0,
+    error TEXT,
+    media_type TEXT,
+    filename TEXT,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+)
+"""
+
+TERMINAL_STATUSES = ("done", "failed")
+
+
+class JobQueue:
+    """
+    SQLite-backed job queue with a fixed number of worker threads
+
+    handler(job, progress) runs in a worker with the job's row as a dict
+    (input_path and params included) and returns (data, media_type, filename);
+    progress(stage, fraction) records how far along the job is. Anything the
+    handler adds to params is saved with the finished job.
+    """
+
+    def __init__(self, job_dir: str, handler=None, workers: int = 1, max_queued: int = 100,
+                 ttl: float = 24 * 3600):
+        self.job_dir = Path(job_dir)
+        self.job_dir.mkdir(parents=True, exist_ok=True)
+        self.handler = handler
+        self.workers = workers
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self._db = None
+        self._db_pid = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition()
+        self._threads = []
+        self._stopping = False
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, so each process opens its own
+        if self._db_pid != os.getpid():
+            self._db = sqlite3.connect(str(self.job_dir / "jobs.db"), check_same_thread=False, isolation_level=None)
+            self._db.row_factory = sqlite3.Row
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(SCHEMA)
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def input_path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.in"
+
+    def result_path(self, job_id: str) -> Path:
+        return self.job_dir / f"{job_id}.out"
+
+    def submit(self, source, params: dict) -> str:
+        """Store the upload (a binary file) and queue a job for it; returns the job id"""
+        queued = self._execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= self.max_queued:
+            raise PoolFullError(self.retry_after(queued))
+
+        job_id = uuid.uuid4().hex
+        source.seek(0)
+        with open(self.input_path(job_id), "wb") as f:
+            shutil.copyfileobj(source, f)
+        self._execute(
+            "INSERT INTO jobs (id, status, params, stage, created) VALUES (?, 'queued', ?, 'queued', ?)",
+            (job_id, json.dumps(params), time.time()),
+        )
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def get(self, job_id: str):
+        """Status of a job as a dict, or None if it is unknown or expired"""
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["params"] = json.loads(job["params"])
+        if job["status"] == "queued":
+            job["position"] = self._execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created < ?", (job["created"],)
+            ).fetchone()[0]
+        return job
+
+    def retry_after(self, queued: int) -> int:
+        """Estimate how long the queue needs to drain, in whole seconds"""
+        row = self._execute(
+            "SELECT AVG(finished - started) FROM jobs WHERE status = 'done' AND finished IS NOT NULL"
+        ).fetchone()
+        avg_run = row[0] or 30.0
+        return max(1, int(avg_run * queued / self.workers))
+
+    def _claim(self):
+        """Take the oldest queued job, or return None if there is none"""
+        while True:
+            row = self._execute(
+                "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = self._execute(
+                "UPDATE jobs SET status = 'running', started = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), row["id"]),
+            ).rowcount
+            # Another worker (or process) got there first: try the next one
+            if claimed:
+                job = dict(row)
+                job["params"] = json.loads(job["params"])
+                job["input_path"] = str(self.input_path(job["id"]))
+                return job
+
+    def _progress(self, job_id: str):
+        def progress(stage: str, fraction: float):
+            self._execute("UPDATE jobs SET stage = ?, progress = ? WHERE id = ?", (stage, fraction, job_id))
+        return progress
+
+    def _run(self, job: dict):
+        job_id = job["id"]
+        try:
+            data, media_type, filename = self.handler(job, self._progress(job_id))
+            tmp = self.result_path(job_id).with_suffix(".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, self.result_path(job_id))
+            self._execute(
+                "UPDATE jobs SET status = 'done', stage = 'done', progress = 1, media_type = ?, filename = ?, "
+                "params = ?, finished = ? WHERE id = ?",
+                (media_type, filename, json.dumps(job["params"]), time.time(), job_id),
+            )
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            detail = getattr(e, "detail", None) or "An error occurred while processing your image."
+            self._execute(
+                "UPDATE jobs SET status = 'failed', stage = 'failed', error = ?, finished = ? WHERE id = ?",
+                (str(detail), time.time(), job_id),
+            )
+        finally:
+            self.input_path(job_id).unlink(missing_ok=True)
+
+    def expire(self):
+        """Delete finished jobs, and their files, older than ttl"""
+        cutoff = time.time() - self.ttl
+        expired = self._execute(
+            "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (cutoff,)
+        ).fetchall()
+        for row in expired:
+            self.result_path(row["id"]).unlink(missing_ok=True)
+            self._execute("DELETE FROM jobs WHERE id = ?", (row["id"],))
+
+    def _worker(self):
+        last_expiry = 0.0
+        while not self._stopping:
+            if time.time() - last_expiry > 60:
+                self.expire()
+                last_expiry = time.time()
+            job = self._claim()
+            if job is None:
+                # Poll as well, for jobs queued by other processes
+                with self._wakeup:
+                    self._wakeup.wait(timeout=1.0)
+                continue
+            self._run(job)
+
+    def requeue_unfinished(self):
+        """Queue again any jobs a previous run left running"""
+        self._execute("UPDATE jobs SET status = 'queued', stage = 'queued', progress = 0 WHERE status = 'running'")
+
+    def start(self, requeue: bool = True):
+        """
+        Start the worker threads, after queueing again any jobs a previous run left unfinished
+        Pre-forked workers pass requeue=False, since their siblings' running jobs are not
+        unfinished; the master requeues once before forking them
+        """
+        if requeue:
+            self.requeue_unfinished()
+        self._stopping = False
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        """Ask the workers to exit after their current job"""
+        self._stopping = True
+        with self._wakeup:
+            self._wakeup.notify_all()
+        self._threads = []
+
+    def stats(self) -> dict:
+        counts = dict(self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        return {
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            **{status: counts.get(status, 0) for status in ("queued", "running", *TERMINAL_STATUSES)},
+        }
+
+
+def jobs_from_env(handler=None) -> JobQueue:
+    """Build a JobQueue from PIXELFORGE_JOB_* environment variables"""
+    return JobQueue(
+        job_dir=os.environ.get("PIXELFORGE_JOB_DIR") or os.path.join(tempfile.gettempdir(), "pixelforge-jobs"),
+        handler=handler,
+        workers=int(os.environ.get("PIXELFORGE_JOB_WORKERS", 1)),
+        max_queued=int(os.environ.get("PIXELFORGE_JOB_QUEUE", 100)),
+        ttl=float(os.environ.get("PIXELFORGE_JOB_TTL", 24 * 3600)),
+    )
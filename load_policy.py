@@ -0,0 +1,116 @@
+"""
+Load-adaptive upscale quality
+
+EDSR on CPU takes seconds per image, so in a traffic spike every request
+queues behind inference and latency climbs for everyone. LoadPolicy watches
+the worker pool's queue depth and the inference time of recent requests
+against a latency SLO. While the server is overloaded it steps quality down
+a level:
+
+    full      the configured scale plan
+    light     one pass of the smallest native model, Lanczos for the rest
+    lanczos   Lanczos alone
+
+It steps down when the queue reaches its limit or recent inference runs over
+the SLO, at most once per step interval. It steps back up one level at a
+time, and only once the queue is empty, inference is well inside the SLO
+and the level has been held for the hold time, so it does not flap at the
+threshold. Inference samples are dropped at every switch, so each level is
+judged on its own requests.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+LEVELS = ("full", "light", "lanczos")
+
+# Recent inference samples averaged, and how many are needed before they count
+LATENCY_WINDOW = 8
+MIN_SAMPLES = 3
+
+# Stepping back up needs inference under this fraction of the SLO
+RECOVER_RATIO = 0.7
+
+
+class LoadPolicy:
+    """Quality level for new requests, from queue depth and recent inference time"""
+
+    def __init__(self, queue_depth, slo_seconds: float, max_queue: int, hold_seconds: float = 30.0,
+                 step_seconds: float = 5.0):
+        self.queue_depth = queue_depth  # callable returning the jobs waiting for a worker
+        self.slo_seconds = slo_seconds
+        self.max_queue = max_queue
+        self.hold_seconds = hold_seconds
+        self.step_seconds = step_seconds
+        self.level = 0
+        self.switches = 0
+        self._changed = time.monotonic() - max(hold_seconds, step_seconds)
+        self._samples = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.slo_seconds > 0
+
+    def observe(self, timings):
+        """Record a finished request's inference time (requests without inference are skipped)"""
+        seconds = sum(seconds for stage, _, _, seconds in timings.samples if stage == "inference")
+        if seconds:
+            with self._lock:
+                self._samples.append(seconds)
+
+    def _latency(self):
+        if len(self._samples) < MIN_SAMPLES:
+            return None
+        return sum(self._samples) / len(self._samples)
+
+    def current(self) -> str:
+        """The level for a request starting now, stepping first if the load calls for it"""
+        if not self.enabled:
+            return LEVELS[0]
+        with self._lock:
+            now = time.monotonic()
+            held = now - self._changed
+            queued = self.queue_depth()
+            latency = self._latency()
+            overloaded = queued >= self.max_queue or (latency is not None and latency > self.slo_seconds)
+            relaxed = queued == 0 and (latency is None or latency <= self.slo_seconds * RECOVER_RATIO)
+            if overloaded and self.level < len(LEVELS) - 1 and held >= self.step_seconds:
+                self._step(1, now, queued, latency)
+            elif relaxed and self.level > 0 and held >= self.hold_seconds:
+                self._step(-1, now, queued, latency)
+            return LEVELS[self.level]
+
+    def _step(self, direction: int, now: float, queued: int, latency):
+        previous = LEVELS[self.level]
+        self.level += direction
+        self.switches += 1
+        self._changed = now
+        self._samples.clear()
+        inference = f"{latency:.1f}s" if latency is not None else "n/a"
+        print(f"Load policy: {previous} -> {LEVELS[self.level]} (queued {queued}, inference {inference}, "
+              f"SLO {self.slo_seconds:g}s)")
+
+    def stats(self) -> dict:
+        with self._lock:
+            latency = self._latency()
+            return {
+                "enabled": self.enabled,
+                "level": LEVELS[self.level],
+                "slo_seconds": self.slo_seconds,
+                "max_queue": self.max_queue,
+                "recent_inference_seconds": round(latency, 3) if latency is not None else None,
+                "switches": self.switches,
+            }
+
+
+def policy_from_env(worker_pool) -> LoadPolicy:
+    """Build a LoadPolicy on a WorkerPool's queue from PIXELFORGE_LATENCY_SLO and PIXELFORGE_DEGRADE_*"""
+    return LoadPolicy(
+        lambda: worker_pool.stats()["queued"],
+        slo_seconds=float(os.environ.get("PIXELFORGE_LATENCY_SLO", 10)),
+        max_queue=int(os.environ.get("PIXELFORGE_DEGRADE_QUEUE", worker_pool.max_workers)),
+        hold_seconds=float(os.environ.get("PIXELFORGE_DEGRADE_HOLD", 30)),
+        step_seconds=float(os.environ.get("PIXELFORGE_DEGRADE_STEP", 5)),
+    )
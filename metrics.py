@@ -0,0 +1,230 @@
+"""
+Per-stage latency histograms and a Prometheus text endpoint
+
+Each request collects how long it spent in every pipeline stage (decode,
+model load, inference, resize, encode) in a StageTimings, labelled with the
+resolution preset and the engine (EDSR, or Lanczos when the model was not
+used or failed). StageTimings is a plain object, so it comes back from
+process-pool workers with the result. The servers fold it into histograms
+served as Prometheus text on GET /metrics. Queue depth, cache counters and
+memory are read from their owners as callback gauges when /metrics is
+scraped. The same timings go out on each response as a Server-Timing header.
+
+No client library is needed; the exposition format is written out here.
+"""
+import bisect
+import resource
+import threading
+import time
+from contextlib import contextmanager
+
+# Seconds; spans a cached 2K encode up to a multi-pass 4K EDSR run on CPU
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class StageTimings:
+    """Stage durations for one request, each with the preset and engine it ran for"""
+
+    def __init__(self):
+        self.samples = []  # (stage, resolution, engine, seconds)
+        self.engines = {}  # resolution -> engine that produced it
+        self.fallbacks = set()  # resolutions whose model failed and were resized with Lanczos instead
+
+    def add(self, stage: str, seconds: float, resolution: str = "", engine: str = ""):
+        self.samples.append((stage, resolution, engine, seconds))
+
+    @contextmanager
+    def time(self, stage: str, resolution: str = "", engine: str = ""):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start, resolution, engine)
+
+    def merge(self, other: "StageTimings"):
+        """Add the samples and engines of another StageTimings, e.g. one sent back by a worker process"""
+        self.samples.extend(other.samples)
+        self.engines.update(other.engines)
+        self.fallbacks.update(other.fallbacks)
+
+    def totals(self) -> dict:
+        """Seconds per stage, summed over presets, in the order stages first ran"""
+        totals = {}
+        for stage, _, _, seconds in self.samples:
+            totals[stage] = totals.get(stage, 0.0) + seconds
+        return totals
+
+    def server_timing(self, **extra) -> str:
+        """
+        Server-Timing header value with a dur per stage
+        extra adds metrics such as total=seconds, or cache="HIT" as a description
+        """
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.totals().items()]
+        for name, value in extra.items():
+            if isinstance(value, str):
+                parts.append(f'{name};desc="{value}"')
+            else:
+                parts.append(f"{name};dur={value * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label combination"""
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(labels, [0] * (len(self.buckets) + 2))
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), labels + (bound,))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), labels + ('+Inf',))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {values[-2]:.6f}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {values[-1]}")
+        return lines
+
+
+class Registry:
+    """Histograms plus gauges and counters read from callbacks at scrape time"""
+
+    def __init__(self):
+        self.histograms = []
+        self.callbacks = []  # (name, help, type, labelnames, fn)
+
+    def histogram(self, name: str, help_text: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        histogram = Histogram(name, help_text, labelnames, buckets)
+        self.histograms.append(histogram)
+        return histogram
+
+    def gauge(self, name: str, help_text: str, fn, labelnames: tuple = (), kind: str = "gauge"):
+        """
+        fn() returns a number, or a dict of label-value tuples to numbers when
+        labelnames are given. None values are left out
+        """
+        self.callbacks.append((name, help_text, kind, tuple(labelnames), fn))
+
+    def counter(self, name: str, help_text: str, fn, labelnames: tuple = ()):
+        self.gauge(name, help_text, fn, labelnames, kind="counter")
+
+    def render(self) -> str:
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for name, help_text, kind, labelnames, fn in self.callbacks:
+            try:
+                value = fn()
+            except Exception as e:
+                print(f"Metric {name} failed: {e}")
+                continue
+            samples = value.items() if labelnames else [((), value)]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, sample in samples:
+                if sample is not None:
+                    lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(sample)}")
+        return "\n".join(lines) + "\n"
+
+
+def process_rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is unavailable)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class ServerMetrics(Registry):
+    """
+    The stage histogram plus the gauges every server shares: worker pool
+    queue depth and in-flight count, cache counters and process RSS
+    caches maps a label (e.g. "result") to a ResultCache
+    """
+
+    def __init__(self, worker_pool, caches: dict):
+        super().__init__()
+        self.worker_pool = worker_pool
+        self.stage_seconds = self.histogram(
+            "pixelforge_stage_seconds", "Time spent in each pipeline stage", ("stage", "resolution", "engine")
+        )
+        self.gauge("pixelforge_queue_depth", "Pipeline jobs waiting for a worker",
+                   lambda: worker_pool.stats()["queued"])
+        self.gauge("pixelforge_in_flight", "Pipeline jobs running in the worker pool",
+                   lambda: worker_pool.stats()["in_flight"])
+        self.gauge("pixelforge_pool_workers", "Worker pool size", lambda: worker_pool.max_workers)
+        self.counter("pixelforge_pool_rejected_total", "Pipeline jobs turned away with 503",
+                     lambda: worker_pool.rejected)
+        for counter in ("hits", "misses", "evictions"):
+            self.counter(
+                f"pixelforge_cache_{counter}_total", f"Cache {counter}",
+                lambda counter=counter: {(name,): cache.stats().get(counter) for name, cache in caches.items()},
+                ("cache",)
+            )
+        self.gauge("pixelforge_cache_bytes", "Bytes held in memory by each cache",
+                   lambda: {(name,): cache.stats()["bytes"] for name, cache in caches.items()}, ("cache",))
+        self.gauge("pixelforge_cache_entries", "Entries held in memory by each cache",
+                   lambda: {(name,): cache.stats()["entries"] for name, cache in caches.items()}, ("cache",))
+        self.gauge("pixelforge_process_resident_memory_bytes", "Resident memory of the server process",
+                   process_rss_bytes)
+
+    def record(self, timings: StageTimings):
+        """Fold a request's timings into the stage histogram and the worker pool's stage totals"""
+        for stage, resolution, engine, seconds in timings.samples:
+            self.stage_seconds.observe(seconds, stage, resolution, engine)
+        for stage, seconds in timings.totals().items():
+            self.worker_pool.record(stage, 0.0, seconds)
+
+
+class ServerTimingMiddleware:
+    """
+    Adds a Server-Timing "total" entry to every HTTP response: the time the
+    app took to start it, which for a streamed body is before it finishes
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                total = f"total;dur={(time.perf_counter() - start) * 1000:.1f}".encode()
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", total)]
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
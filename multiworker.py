@@ -0,0 +1,114 @@
+"""
+Pre-fork multi-process server mode
+
+uvicorn's own --workers starts every worker as a fresh interpreter, so each
+one loads its own copy of the EDSR weights and sizes PyTorch's thread pool
+for the whole machine: memory grows with the worker count and the workers'
+threads fight over the cores. Here the master process loads the models once
+(preload), then forks the workers, which read the master's weights in place:
+the pages stay shared copy-on-write because inference never writes to them.
+Each worker gets an even share of the cores for its intra-op threads
+(init_worker), and all of them accept from one listening socket, so the
+kernel hands each new connection to whichever worker takes it first.
+
+The master does no request work. It restarts workers that die and passes
+SIGINT/SIGTERM on to them for a graceful shutdown.
+"""
+import os
+import signal
+import socket
+import time
+
+import uvicorn
+
+WORKER_INDEX = None  # This process's worker number, once forked
+
+
+def is_worker() -> bool:
+    """Whether this process is a forked worker (and not a single-process server or the master)"""
+    return WORKER_INDEX is not None
+
+
+def cpu_share(workers: int) -> int:
+    """Cores available to this process, split evenly between workers"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    return max(1, cores // workers)
+
+
+def _run_worker(app, sock: socket.socket, index: int, workers: int, init_worker, log_level: str):
+    global WORKER_INDEX
+    WORKER_INDEX = index
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if init_worker is not None:
+        init_worker(index, workers)
+    print(f"Worker {index} started (pid {os.getpid()})")
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+
+
+def serve_workers(app, host: str, port: int, workers: int, preload=None, init_worker=None,
+                  log_level: str = "info"):
+    """
+    Run app in workers forked processes sharing one listening socket
+    preload() runs in the master before the first fork; init_worker(index,
+    workers) runs in each worker after it is forked
+    """
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    if preload is not None:
+        preload()
+
+    children = {}  # pid -> worker index
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app, sock, index, workers, init_worker, log_level)
+            except BaseException as e:
+                print(f"Worker {index} failed: {e}")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    for index in range(workers):
+        spawn(index)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Serving on {host}:{port} with {workers} workers (master pid {os.getpid()})")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        # A worker that dies is replaced, after a pause so a crash at startup does not spin
+        print(f"Worker {index} (pid {pid}) exited with status {os.waitstatus_to_exitcode(status)}, restarting")
+        time.sleep(1)
+        if not stopping:
+            spawn(index)
+    sock.close()
@@ -0,0 +1,241 @@
+"""
+Shared rate-limit storage and cost-weighted quotas
+
+slowapi's default storage keeps its counters in process memory. With several
+uvicorn workers or nodes, each one counts on its own and a client gets N
+times the quota. PIXELFORGE_RATE_LIMIT_STORAGE picks a storage that every
+process shares:
+
+    memory://                  per process (the old behaviour)
+    sqlite:///var/lib/pf.db    one SQLite file for all workers on a host (a path
+                               under /dev/shm keeps it in shared memory)
+    redis://host:6379          Redis, via the limits package (needs redis installed)
+
+The SQLite storage talks to its database through the handful of Redis
+commands a fixed window needs (INCRBY, EXPIRE, TTL, GET, DEL), so a
+redis.Redis client can be passed in its place as storage_options={"client": ...}.
+
+Quotas are per client: a known X-API-Key gets its own quota (and optionally its
+own limit), and anything else is counted by address, taken from
+X-Forwarded-For when the request comes from a trusted proxy. A request costs
+one unit per 2K frame of output, rounded up, so a 4K upscale costs 3 and a
+batch costs the sum over its images and presets.
+"""
+import hashlib
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from fastapi import HTTPException
+from limits import parse
+from limits.storage import Storage
+from slowapi import Limiter
+
+RATE_LIMIT = os.environ.get("PIXELFORGE_RATE_LIMIT", "10/hour")
+QUOTA_UNIT_PIXELS = 2560 * 1440  # one 2K output frame
+
+# "key" or "key=limit" entries, comma separated; keys without a limit use RATE_LIMIT
+API_KEYS = {}
+for entry in filter(None, (e.strip() for e in os.environ.get("PIXELFORGE_API_KEYS", "").split(","))):
+    api_key, _, key_limit = entry.partition("=")
+    API_KEYS[api_key.strip()] = key_limit.strip() or None
+
+# Peers whose X-Forwarded-For is believed; "*" trusts any
+TRUSTED_PROXIES = {p.strip() for p in os.environ.get("PIXELFORGE_TRUSTED_PROXIES", "127.0.0.1").split(",") if p.strip()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires REAL
+)
+"""
+
+
+class SQLiteCounters:
+    """
+    The Redis commands a fixed-window limiter needs, on a SQLite file that
+    any number of processes can open. Values come back as bytes, as from redis-py
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _connection(self) -> sqlite3.Connection:
+        # A connection must not cross a fork, so each process opens its own
+        if self._pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(SCHEMA)
+            self._pid = os.getpid()
+        return self._db
+
+    def _execute(self, sql: str, params=()):
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM counters WHERE key = ? AND expires <= ?", (key, time.time()))
+                db.execute(
+                    "INSERT INTO counters (key, value) VALUES (?, ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+                    (key, amount),
+                )
+                value = db.execute("SELECT value FROM counters WHERE key = ?", (key,)).fetchone()[0]
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return value
+
+    def expire(self, key: str, seconds: float) -> bool:
+        rows = self._execute("UPDATE counters SET expires = ? WHERE key = ? RETURNING key", (time.time() + seconds, key))
+        return bool(rows)
+
+    def get(self, key: str):
+        rows = self._execute(
+            "SELECT value FROM counters WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        )
+        return str(rows[0][0]).encode() if rows else None
+
+    def ttl(self, key: str) -> int:
+        """Seconds left, -1 for no expiry and -2 for a missing key, as in Redis"""
+        rows = self._execute("SELECT expires FROM counters WHERE key = ?", (key,))
+        if not rows:
+            return -2
+        if rows[0][0] is None:
+            return -1
+        left = rows[0][0] - time.time()
+        return math.ceil(left) if left > 0 else -2
+
+    def delete(self, *keys: str) -> int:
+        return sum(len(self._execute("DELETE FROM counters WHERE key = ? RETURNING key", (key,))) for key in keys)
+
+    def scan_iter(self, match: str = "*"):
+        # Redis MATCH patterns are globs, as are SQLite's
+        return [key.encode() for (key,) in self._execute("SELECT key FROM counters WHERE key GLOB ?", (match,))]
+
+    def ping(self) -> bool:
+        self._execute("SELECT 1")
+        return True
+
+
+class CounterStorage(Storage):
+    """limits storage over a Redis-compatible client; sqlite:// URIs get a SQLiteCounters"""
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str = None, wrap_exceptions: bool = False, client=None, **options):
+        super().__init__(uri, wrap_exceptions, **options)
+        self.client = client if client is not None else SQLiteCounters(uri.split("://", 1)[1])
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error if isinstance(self.client, SQLiteCounters) else Exception
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        value = self.client.incrby(key, amount)
+        # The first hit in a window starts its clock
+        if value == amount:
+            self.client.expire(key, expiry)
+        return value
+
+    def get(self, key: str) -> int:
+        return int(self.client.get(key) or 0)
+
+    def get_expiry(self, key: str) -> float:
+        return time.time() + max(self.client.ttl(key), 0)
+
+    def check(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception:
+            return False
+
+    def reset(self) -> int:
+        keys = list(self.client.scan_iter(match="LIMITER*"))
+        return self.client.delete(*keys) if keys else 0
+
+    def clear(self, key: str) -> None:
+        self.client.delete(key)
+
+
+def client_address(request) -> str:
+    """The client's address, from X-Forwarded-For when the peer is a trusted proxy"""
+    peer = request.client.host if request.client else "127.0.0.1"
+    forwarded = request.headers.get("x-forwarded-for")
+    if not forwarded or ("*" not in TRUSTED_PROXIES and peer not in TRUSTED_PROXIES):
+        return peer
+    # The rightmost address no trusted proxy added is the one the client can't forge
+    for address in reversed([a.strip() for a in forwarded.split(",") if a.strip()]):
+        if "*" in TRUSTED_PROXIES or address not in TRUSTED_PROXIES:
+            return address
+    return peer
+
+
+def api_key_id(api_key: str) -> str:
+    # Only a digest of the key reaches the shared storage
+    return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+def client_key(request) -> str:
+    """Quota key for a request: its API key when the key is known, otherwise its address"""
+    api_key = request.headers.get("x-api-key")
+    if api_key in API_KEYS:
+        return api_key_id(api_key)
+    return "ip:" + client_address(request)
+
+
+def output_cost(sizes: list) -> int:
+    """Quota units for producing outputs of the given (width, height) sizes"""
+    return sum(math.ceil(width * height / QUOTA_UNIT_PIXELS) for width, height in sizes)
+
+
+def limiter_from_env() -> Limiter:
+    """
+    Build a slowapi Limiter on the PIXELFORGE_RATE_LIMIT_STORAGE storage; with
+    several PIXELFORGE_WORKERS it defaults to a SQLite file they all share
+    """
+    default = "memory://"
+    if int(os.environ.get("PIXELFORGE_WORKERS", 1)) > 1:
+        default = "sqlite://" + os.path.join(tempfile.gettempdir(), "pixelforge-ratelimit.db")
+    return Limiter(key_func=client_key, storage_uri=os.environ.get("PIXELFORGE_RATE_LIMIT_STORAGE", default))
+
+
+class Quota:
+    """Cost-weighted quota per client, kept in a Limiter's storage and switched off with it"""
+
+    def __init__(self, limiter: Limiter, default_limit: str = RATE_LIMIT):
+        self.limiter = limiter
+        self.default_limit = parse(default_limit)
+        self.key_limits = {
+            api_key_id(api_key): parse(key_limit) for api_key, key_limit in API_KEYS.items() if key_limit
+        }
+
+    def charge(self, request, cost: int):
+        """Take cost units from the client's quota, or raise a 429 if it does not have them"""
+        if not self.limiter.enabled:
+            return
+        key = client_key(request)
+        item = self.key_limits.get(key, self.default_limit)
+        strategy = self.limiter.limiter
+        # Test first: a fixed-window hit counts even when it fails
+        if strategy.test(item, key, "quota", cost=cost) and strategy.hit(item, key, "quota", cost=cost):
+            return
+        reset, remaining = strategy.get_window_stats(item, key, "quota")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded: {item}. This request costs {cost} "
+                   f"(one per 2K output), {remaining} left in this window",
+            headers={"Retry-After": str(max(1, math.ceil(reset - time.time())))}
+        )
@@ -0,0 +1,103 @@
+"""
+Multi-core Lanczos resizing
+
+Pillow resizes on one core, so the resize to a 4K preset (the whole upscale
+on the Lanczos engine, and the final fit after EDSR) kept one core busy
+while the rest idled. resize() cuts the output into horizontal strips and
+resizes them in threads from the same source, through Image.resize's box
+argument. Pillow releases the GIL while it resamples. Given a box, it reads
+only the source rows a strip's kernel reaches (the strip plus the filter's
+support on either side) and places the kernel as a full-frame resize would.
+The strips therefore agree with a single img.resize to within one level
+per channel, from rounding of the fractional box edges. Images with alpha
+are premultiplied once around the strips, as Pillow does around a single
+resize, so the tolerance holds in premultiplied terms.
+
+The filter weights are computed in Pillow's C resampler per strip, which
+costs one row of weights per output row and column and is small next to
+the resample. The strip layout is cached per (source size, output size,
+strips). The thread pool is made on first use, so it never has to cross a
+fork.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from PIL import Image
+
+# Threads per resize; 1 keeps Pillow's single-threaded resize (0 uses every core)
+CONFIGURED_THREADS = int(os.environ.get("PIXELFORGE_RESIZE_THREADS", 0))
+
+# Outputs below this size, or strips thinner than this, are not worth a thread
+MIN_PARALLEL_PIXELS = 1_000_000
+MIN_STRIP_ROWS = 64
+
+PREMULTIPLIED = {"RGBA": "RGBa", "LA": "La"}
+
+
+def available_cores() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+RESIZE_THREADS = CONFIGURED_THREADS or available_cores()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def set_resize_threads(threads: int):
+    """Threads per resize (e.g. a worker's share of the cores), unless PIXELFORGE_RESIZE_THREADS fixes them"""
+    global RESIZE_THREADS, _pool
+    with _pool_lock:
+        RESIZE_THREADS = max(1, CONFIGURED_THREADS or threads)
+        if _pool is not None:
+            _pool.shutdown(wait=False)
+            _pool = None
+
+
+def _strip_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(RESIZE_THREADS, thread_name_prefix="resize")
+    return _pool
+
+
+@lru_cache(maxsize=256)
+def strip_boxes(source_size: tuple, size: tuple, strips: int) -> tuple:
+    """(first row, last row, source box) of each output strip"""
+    source_width, source_height = source_size
+    width, height = size
+    rows = -(-height // strips)
+    return tuple(
+        (top, min(height, top + rows),
+         (0, top * source_height / height, source_width, min(height, top + rows) * source_height / height))
+        for top in range(0, height, rows)
+    )
+
+
+def resize(img: Image.Image, size: tuple, resample=Image.LANCZOS) -> Image.Image:
+    """img.resize(size, resample), split across RESIZE_THREADS threads for large outputs"""
+    width, height = size
+    strips = min(RESIZE_THREADS, height // MIN_STRIP_ROWS)
+    if (strips < 2 or width * height < MIN_PARALLEL_PIXELS or img.mode in ("1", "P")
+            or resample == Image.NEAREST):
+        return img.resize(size, resample)
+
+    premultiplied = PREMULTIPLIED.get(img.mode)
+    source = img.convert(premultiplied) if premultiplied else img
+    source.load()
+
+    pool = _strip_pool()
+    parts = [
+        (top, pool.submit(source.resize, (width, bottom - top), resample, box))
+        for top, bottom, box in strip_boxes(img.size, size, strips)
+    ]
+    output = Image.new(source.mode, size)
+    for top, part in parts:
+        output.paste(part.result(), (0, top))
+    return output.convert(img.mode) if premultiplied else output
@@ -0,0 +1,176 @@
+"""
+Content-addressed cache for encoded upscale results
+
+Keys are derived from a SHA-256 of the uploaded bytes plus the resolution
+preset and engine, so re-uploading the same image skips decode, inference
+and encode entirely. Entries live in an in-memory LRU bounded by total bytes;
+an optional on-disk tier (PIXELFORGE_CACHE_DIR) keeps results across
+restarts and is bounded the same way, evicting the least recently used file.
+"""
+from collections import OrderedDict
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+from PIL import Image
+
+
+def content_digest(source) -> str:
+    """SHA-256 of an upload (bytes or a binary file read in chunks), computed once per request"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    digest = hashlib.sha256()
+    source.seek(0)
+    for chunk in iter(lambda: source.read(1024 * 1024), b""):
+        digest.update(chunk)
+    source.seek(0)
+    return digest.hexdigest()
+
+
+def cache_key(digest: str, *parts) -> str:
+    """Hex key for an upload digest and the options that affect its output"""
+    return hashlib.sha256(":".join([digest, *map(str, parts)]).encode()).hexdigest()
+
+
+def entry_size(data) -> int:
+    """Bytes held by a cached value: encoded bytes or a decoded PIL image"""
+    if isinstance(data, Image.Image):
+        return data.width * data.height * len(data.getbands())
+    return len(data)
+
+
+class ResultCache:
+    """
+    Byte-bounded LRU of encoded results with an optional disk tier
+    Memory-only caches may also hold PIL images (see entry_size)
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, disk_dir: str = None,
+                 disk_max_bytes: int = 2 * 1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk = OrderedDict()
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "disk_evictions": 0}
+        if self.disk_dir:
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        """Index existing cache files, oldest access first"""
+        self.disk_dir.mkdir(parents=True, exist_ok=True)
+        entries = []
+        for path in self.disk_dir.glob("*.bin"):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    @property
+    def entry_limit(self) -> int:
+        """Size of the largest value put() would keep, in memory or on disk"""
+        return max(self.max_bytes, self.disk_max_bytes if self.disk_dir else 0)
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def get(self, key: str):
+        """Return the cached value for key, or None"""
+        return self.get_any([key])[1]
+
+    def get_any(self, keys: list):
+        """(key, value) for the first of keys that is cached, or (None, None); one hit or miss is counted"""
+        with self._lock:
+            for key in keys:
+                data = self._get(key)
+                if data is not None:
+                    self.counters["hits"] += 1
+                    return key, data
+            self.counters["misses"] += 1
+            return None, None
+
+    def _get(self, key: str):
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            return data
+        if key in self._disk:
+            path = self.disk_dir / f"{key}.bin"
+            try:
+                data = path.read_bytes()
+                os.utime(path)
+            except OSError:
+                self._disk_bytes -= self._disk.pop(key)
+            else:
+                self._disk.move_to_end(key)
+                self.counters["disk_hits"] += 1
+                self._put_memory(key, data)
+                return data
+        return None
+
+    def put(self, key: str, data):
+        """Store data under key in memory and, if enabled, on disk"""
+        with self._lock:
+            self._put_memory(key, data)
+            if self.disk_dir and key not in self._disk and len(data) <= self.disk_max_bytes:
+                path = self.disk_dir / f"{key}.bin"
+                tmp_path = path.with_suffix(".tmp")
+                try:
+                    tmp_path.write_bytes(data)
+                    os.replace(tmp_path, path)
+                except OSError as e:
+                    print(f"Failed to write cache entry: {e}")
+                    return
+                self._disk[key] = len(data)
+                self._disk_bytes += len(data)
+                self._evict_disk()
+
+    def _put_memory(self, key: str, data):
+        size = entry_size(data)
+        if size > self.max_bytes:
+            return
+        if key in self._memory:
+            self._memory_bytes -= entry_size(self._memory.pop(key))
+        self._memory[key] = data
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= entry_size(evicted)
+            self.counters["evictions"] += 1
+
+    def _evict_disk(self):
+        while self._disk_bytes > self.disk_max_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self.counters["disk_evictions"] += 1
+            try:
+                (self.disk_dir / f"{key}.bin").unlink()
+            except OSError:
+                pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._memory),
+                "bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk) if self.disk_dir else None,
+                "disk_bytes": self._disk_bytes if self.disk_dir else None,
+            }
+
+
+def cache_from_env() -> ResultCache:
+    """Build a ResultCache from PIXELFORGE_CACHE_* environment variables"""
+    return ResultCache(
+        max_bytes=int(os.environ.get("PIXELFORGE_CACHE_MB", 256)) * 1024 * 1024,
+        disk_dir=os.environ.get("PIXELFORGE_CACHE_DIR") or None,
+        disk_max_bytes=int(os.environ.get("PIXELFORGE_CACHE_DISK_MB", 2048)) * 1024 * 1024,
+    )
@@ -1,28 +1,68 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, FileResponse
-from fastapi.staticfiles import StaticFiles
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from fastapi.responses import Response, StreamingResponse, FileResponse, JSONResponse
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from PIL import Image
+import asyncio
 import io
+import json
 import os
-from typing import Literal
+import sys
+import threading
+from typing import List, Literal, Optional
+from contextlib import asynccontextmanager
 import time
+import zipfile
+from functools import partial
+from worker_pool import PoolFullError, pool_from_env
+from encoding import ALPHA_MODES, OUTPUT_FORMATS, OutputFormat, encode_image, resolve_output_format
+from result_cache import ResultCache, cache_from_env, cache_key, content_digest
+from streaming import ChunkPipe, open_stream, write_to_pipe
+from job_queue import TERMINAL_STATUSES, jobs_from_env
+from batch import batch_cli, batch_inputs, stream_batch
+from uploads import (MULTIPART_OVERHEAD, UploadError, UploadLimitMiddleware, draft_to_target, header_size,
+                     open_source, pipeline_source, upload_size)
+from transparency import prepare_image
+from metrics import ServerMetrics, ServerTimingMiddleware, StageTimings
+from rate_limits import Quota, limiter_from_env, output_cost
+from multiworker import cpu_share, is_worker, serve_workers
+from engines import engine_from_env
+from static_files import StaticSite
+from resampling import resize, set_resize_threads
+from load_policy import LEVELS, policy_from_env
+from animation import animated_output, is_animated, upscale_animation
+from scale_selection import candidate_plans, plan_name, select_plan
 from pathlib import Path
-import torch
-from super_image import EdsrModel, ImageLoader
-import numpy as np
 
-# Initialize rate limiter
-limiter = Limiter(key_func=get_remote_address)
-app = FastAPI(title="PixelForge AI Upscaler - Real AI Edition")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the models up in the background and run the job queue workers while the server is up"""
+    if AI_WARMUP:
+        threading.Thread(target=warmup_models, name="warmup", daemon=True).start()
+    else:
+        AI_READY.set()
+    # A pre-forked worker leaves requeueing to the master
+    job_queue.start(requeue=not is_worker())
+    yield
+    job_queue.stop()
+
+
+# Rate limiter on shared storage, with quotas per API key or client address weighted by
+# output size (PIXELFORGE_RATE_LIMIT*, PIXELFORGE_API_KEYS and PIXELFORGE_TRUSTED_PROXIES to override)
+limiter = limiter_from_env()
+quota = Quota(limiter)
+app = FastAPI(title="PixelForge AI Upscaler - Real AI Edition", lifespan=lifespan)
 
 # Add rate limit exceeded handler
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
 
+# Server-Timing "total" on every response
+app.add_middleware(ServerTimingMiddleware)
+
 # CORS configuration
 app.add_middleware(
     CORSMiddleware,
@@ -33,9 +73,28 @@ app.add_middleware(
 )
 
 # Supported formats
-SUPPORTED_FORMATS = {"jpg", "jpeg", "png", "webp", "bmp"}
+SUPPORTED_FORMATS = {"jpg", "jpeg", "png", "webp", "bmp", "gif"}
 MAX_FILE_SIZE = 20 * 1024 * 1024  # 20MB
 MIN_DIMENSION = 50
+MAX_BATCH_FILES = 50
+MAX_BATCH_SIZE = 200 * 1024 * 1024  # 200MB per /api/batch request
+MAX_PIXELS = int(os.environ.get("PIXELFORGE_MAX_PIXELS", 40_000_000))  # decoded pixels
+MAX_FRAMES = int(os.environ.get("PIXELFORGE_MAX_FRAMES", 300))  # frames per animated upload
+
+# validate_image enforces MAX_PIXELS after JPEG draft mode, in place of
+# Pillow's own check on the full header size
+Image.MAX_IMAGE_PIXELS = None
+
+# Cut uploads off at the size limit while they stream in
+app.add_middleware(
+    UploadLimitMiddleware,
+    max_bytes=MAX_FILE_SIZE + MULTIPART_OVERHEAD,
+    detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB",
+    path_limits={"/api/batch": (
+        MAX_BATCH_SIZE + MULTIPART_OVERHEAD,
+        f"Batch too large. Maximum size: {MAX_BATCH_SIZE // (1024*1024)}MB"
+    )}
+)
 
 # Resolution presets
 RESOLUTION_PRESETS = {
@@ -43,38 +102,155 @@ RESOLUTION_PRESETS = {
     "4k": (3840, 2160)
 }
 
+# Worker pool for the CPU-bound pipeline (PIXELFORGE_POOL_* to override)
+worker_pool = pool_from_env(default_workers=2)
+
+# Cache of encoded results keyed on upload hash, preset and engine
+result_cache = cache_from_env()
+
 # Get the directory where this script is located
 BASE_DIR = Path(__file__).resolve().parent
-FRONTEND_DIR = BASE_DIR.parent / "frontend"
-
-# AI Model Configuration
-USE_AI_UPSCALING = True  # Toggle between AI and fallback methods
-AI_MODEL = None  # Will be loaded on first use
-
-
-def get_ai_model():
-    """Load AI model (lazy loading to avoid startup delay)"""
-    global AI_MODEL
-    if AI_MODEL is None and USE_AI_UPSCALING:
-        try:
-            print("Loading EDSR AI model for super-resolution...")
-            # Load EDSR model with 4x scale (pre-trained on DIV2K dataset)
-            AI_MODEL = EdsrModel.from_pretrained('eugenesiow/edsr-base', scale=4)
-            # Use CPU for inference (change to cuda if GPU available)
-            device = 'cuda' if torch.cuda.is_available() else 'cpu'
-            AI_MODEL = AI_MODEL.to(device)
-            AI_MODEL.eval()
-            print(f"AI model loaded successfully on {device}")
-        except Exception as e:
-            print(f"Failed to load AI model: {e}")
-            print("Falling back to high-quality interpolation")
-    return AI_MODEL
-
-
-def validate_image(file_bytes: bytes) -> Image.Image:
-    """Validate image file and return PIL Image object"""
+FRONTEND_DIR = Path(os.environ.get("PIXELFORGE_FRONTEND_DIR", BASE_DIR.parent / "frontend"))
+
+# Upscaling engine (see engines.py); PyTorch is only imported when a model engine is chosen
+ENGINE = engine_from_env()
+USE_AI_UPSCALING = bool(ENGINE.scales)  # Toggle between the engine's models and plain Lanczos
+
+# Load and warm up every model at startup; /api/health/ready reports 503 until done
+AI_WARMUP = os.environ.get("PIXELFORGE_WARMUP", "1") != "0"
+AI_READY = threading.Event()
+AI_WARMUP_SECONDS = None
+
+# How many native-scale passes may be chained
+AI_MAX_PASSES = int(os.environ.get("PIXELFORGE_MAX_PASSES", 2))
+
+# Server processes; more than one forks workers that share the loaded models
+SERVER_WORKERS = int(os.environ.get("PIXELFORGE_WORKERS", 1))
+
+# Super-resolved intermediates, reused when a source is requested at another preset
+SR_CACHE = ResultCache(max_bytes=int(os.environ.get("PIXELFORGE_SR_CACHE_MB", 512)) * 1024 * 1024)
+
+# Stage histograms and load gauges, served on /metrics
+METRICS = ServerMetrics(worker_pool, {"result": result_cache, "sr": SR_CACHE})
+METRICS.gauge("pixelforge_model_load_seconds", "Time each model took to load",
+              lambda: {(model,): seconds for model, seconds in ENGINE.load_seconds.items()}, ("scale",))
+METRICS.gauge("pixelforge_warmup_seconds", "Time startup warmup took", lambda: AI_WARMUP_SECONDS)
+METRICS.gauge("pixelforge_ready", "1 once the models are loaded and warmed up", lambda: int(AI_READY.is_set()))
+METRICS.gauge("pixelforge_jobs", "Background jobs by status",
+              lambda: {(status,): count for status, count in job_queue.stats().items()
+                       if status in ("queued", "running", *TERMINAL_STATUSES)}, ("status",))
+
+# Quality steps down while the server is overloaded (PIXELFORGE_LATENCY_SLO and PIXELFORGE_DEGRADE_* to override)
+POLICY = policy_from_env(worker_pool)
+METRICS.gauge("pixelforge_quality_level", "Quality level for new requests (0 full, 1 light, 2 Lanczos)",
+              lambda: POLICY.level)
+METRICS.counter("pixelforge_quality_switches_total", "Load policy quality level changes", lambda: POLICY.switches)
+
+
+def engine_name(level: str = "full") -> str:
+    """The engine output at a quality level comes from, for cache keys and X-AI-Upscaling"""
+    if not USE_AI_UPSCALING or level == "lanczos":
+        return "Lanczos"
+    return ENGINE.name if level == "full" else f"{ENGINE.name}-light"
+
+
+def request_level() -> str:
+    """Quality level for a request starting now: lower while the server is overloaded"""
+    return POLICY.current() if USE_AI_UPSCALING else "full"
+
+
+def record_timings(timings: StageTimings):
+    """Feed a finished pipeline run to the metrics and the load policy"""
+    METRICS.record(timings)
+    POLICY.observe(timings)
+
+
+def cached_outputs(digest: str, presets: list, output: OutputFormat, level: str = "full"):
+    """
+    Cached results per preset (None when missing) and the engine each came from
+    A degraded request also takes results cached at any better level
+    """
+    # (level's engine, engine that ran): a level's plan may still pick Lanczos for small scale factors
+    candidates = list(dict.fromkeys(
+        (name, engine)
+        for name in (engine_name(better) for better in LEVELS[:LEVELS.index(level) + 1])
+        for engine in (name, "Lanczos")
+    ))
+    outputs = {}
+    engines = {}
+    for preset in presets:
+        keys = {cache_key(digest, preset, name, engine, output.cache_tag): engine for name, engine in candidates}
+        key, outputs[preset] = result_cache.get_any(list(keys))
+        if key is not None:
+            engines[preset] = keys[key]
+    return outputs, engines
+
+
+def result_key(digest: str, preset: str, output: OutputFormat, timings: StageTimings, level: str):
+    """
+    Result cache key for a preset a request at level just produced, or None when
+    the model failed over to Lanczos (not worth keeping in place of a retry)
+    Full-quality output counts as full whatever level asked for it
+    """
+    if preset in timings.fallbacks:
+        return None
+    engine = timings.engines[preset]
+    name = engine_name() if engine == ENGINE.name else engine_name(level)
+    return cache_key(digest, preset, name, engine, output.cache_tag)
+
+
+def engines_header(engines: dict) -> str:
+    """X-AI-Upscaling value: the engine each preset actually used, once each"""
+    return ", ".join(dict.fromkeys(engine for engine in engines.values() if engine))
+
+
+def preload_models():
+    """
+    Multi-worker master: load every model once before the workers are forked,
+    so they all read these weights, shared copy-on-write. Engines whose
+    models cannot cross a fork leave loading to each worker
+    """
+    job_queue.requeue_unfinished()
+    if USE_AI_UPSCALING:
+        ENGINE.preload()
+
+
+def init_worker_process(index: int, workers: int):
+    """
+    Multi-worker child or batch CLI process: size the engine's intra-op
+    threads and the resize threads to its share of the cores
+    """
+    ENGINE.set_threads(cpu_share(workers))
+    set_resize_threads(cpu_share(workers))
+
+
+def warmup_models():
+    """
+    Load every configured model and run warmup forwards at the tile sizes
+    inference will use, so the first request pays neither the weight load
+    nor the first-forward allocator and kernel setup. Sets AI_READY when done
+    """
+    global AI_WARMUP_SECONDS
+    start = time.perf_counter()
     try:
-        img = Image.open(io.BytesIO(file_bytes))
+        if USE_AI_UPSCALING:
+            ENGINE.warmup()
+    except Exception as e:
+        print(f"Model warmup failed: {e}")
+    finally:
+        AI_WARMUP_SECONDS = time.perf_counter() - start
+        AI_READY.set()
+        print(f"Warmup finished in {AI_WARMUP_SECONDS:.1f}s, models loaded: {ENGINE.loaded()}")
+
+
+def validate_image(source, target: tuple = None) -> Image.Image:
+    """
+    Validate image file and return PIL Image object
+    Only the header is read here; pixels are decoded later by img.load()
+    A JPEG larger than the target box is set to decode at reduced scale
+    """
+    try:
+        img = Image.open(open_source(source))
         
         # Check format
         if img.format.lower() not in SUPPORTED_FORMATS:
@@ -91,6 +267,23 @@ def validate_image(file_bytes: bytes) -> Image.Image:
                 detail=f"Image too small. Minimum dimensions: {MIN_DIMENSION}x{MIN_DIMENSION}px"
             )
         
+        # Check the pixel budget against what will actually be decoded
+        if target is not None:
+            draft_to_target(img, target)
+        width, height = img.size
+        if width * height > MAX_PIXELS:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Image too large. Maximum: {MAX_PIXELS / 1_000_000:g} megapixels"
+            )
+        
+        # Every frame of an animation is upscaled
+        if is_animated(img) and img.n_frames > MAX_FRAMES:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Animation too long. Maximum: {MAX_FRAMES} frames"
+            )
+        
         return img
     except Exception as e:
         if isinstance(e, HTTPException):
@@ -98,65 +291,45 @@ def validate_image(file_bytes: bytes) -> Image.Image:
         raise HTTPException(status_code=400, detail="Invalid image file")
 
 
-def ai_upscale_image(img: Image.Image, scale_factor: int = 4) -> Image.Image:
+def output_for(source, output: OutputFormat) -> OutputFormat:
+    """The output format for an upload: animations come out as animated WebP"""
+    try:
+        animated = is_animated(Image.open(open_source(source)))
+    except Exception:
+        return output  # validate_image reports what is wrong with it
+    return animated_output(output) if animated else output
+
+
+def ai_upscale_image(img: Image.Image, scale_factor: int = 4, timings: StageTimings = None,
+                     resolution: str = "") -> Image.Image:
     """
-    AI-powered image upscaling using EDSR (Enhanced Deep Super-Resolution)
-    This uses a real deep learning model trained on high-quality image datasets
+    One upscaling pass at a native scale of the configured engine (EDSR by default)
+    Stage times go into timings under resolution; an engine that falls back
+    to Lanczos marks that resolution's engine as Lanczos
     """
-    try:
-        model = get_ai_model()
-        if model is None:
-            raise Exception("AI model not available")
-        
-        # Convert PIL Image to tensor
-        # EDSR expects RGB images
-        if img.mode != 'RGB':
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            else:
-                img = img.convert('RGB')
-        
-        # Use ImageLoader to prepare image for the model
-        inputs = ImageLoader.load_image(img)
-        
-        # Get device
-        device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        inputs = inputs.to(device)
-        
-        # Run AI upscaling
-        with torch.no_grad():
-            outputs = model(inputs)
-        
-        # Convert tensor back to PIL Image
-        output_img = outputs.squeeze().cpu().clamp(0, 255).numpy()
-        output_img = output_img.transpose(1, 2, 0).astype(np.uint8)
-        upscaled_img = Image.fromarray(output_img)
-        
-        return upscaled_img
-        
-    except Exception as e:
-        print(f"AI upscaling failed: {e}")
-        # Fallback to high-quality interpolation
-        return img.resize(
-            (img.width * scale_factor, img.height * scale_factor),
-            Image.LANCZOS
-        )
+    timings = timings if timings is not None else StageTimings()
+    return ENGINE.upscale(img, scale_factor, timings, resolution)
 
 
-def smart_resize_to_resolution(img: Image.Image, target_resolution: str) -> Image.Image:
+def smart_resize_to_resolution(img: Image.Image, target_resolution: str, source_key: str = None,
+                               timings: StageTimings = None, level: str = "full",
+                               source_size: tuple = None) -> Image.Image:
     """
     Intelligently upscale image to target resolution using AI
     Preserves aspect ratio and uses multiple passes if needed
+    Picks the cheapest chain of the engine's native scales that reaches the target
+    With a source_key, the AI output is cached and reused for other presets
+    A lower level (see load_policy.py) runs one light pass or none
+    Stage times, and the engine used, are recorded in timings
+    The output is fitted to source_size, the upload's size before draft decoding (default img.size)
     """
+    timings = timings if timings is not None else StageTimings()
     target_width, target_height = RESOLUTION_PRESETS[target_resolution]
     original_width, original_height = img.size
+    source_width, source_height = source_size or img.size
     
     # Calculate aspect ratios
-    aspect_ratio = original_width / original_height
+    aspect_ratio = source_width / source_height
     target_aspect = target_width / target_height
     
     # Determine target dimensions maintaining aspect ratio
@@ -172,81 +345,260 @@ def smart_resize_to_resolution(img: Image.Image, target_resolution: str) -> Imag
     scale_factor_height = final_height / original_height
     scale_factor = max(scale_factor_width, scale_factor_height)
     
-    # Use AI upscaling if available and scale factor is reasonable
-    if USE_AI_UPSCALING and 1.5 <= scale_factor <= 4:
-        # AI models work best with fixed scale factors (2x, 3x, 4x)
-        # Use 4x scale and then resize to exact dimensions
-        print(f"Using AI upscaling (4x) for {original_width}x{original_height} -> {final_width}x{final_height}")
-        ai_upscaled = ai_upscale_image(img, scale_factor=4)
+    # AI models work best with fixed scale factors (2x, 3x, 4x), so pick the
+    # cheapest native scale (or chain of scales) that reaches the target
+    plan = None
+    if USE_AI_UPSCALING and scale_factor >= 1.5:
+        plan = select_plan(scale_factor, ENGINE.scales, AI_MAX_PASSES)
+    
+    # Any cached intermediate large enough for this target can be reused, whatever the load
+    ai_upscaled = None
+    if plan and source_key:
+        for cached_plan in candidate_plans(scale_factor, ENGINE.scales, AI_MAX_PASSES):
+            if f"{source_key}:{plan_name(cached_plan)}" in SR_CACHE:
+                ai_upscaled = SR_CACHE.get(f"{source_key}:{plan_name(cached_plan)}")
+                if ai_upscaled is not None:
+                    print(f"Reusing cached AI upscale ({plan_name(cached_plan)}) for {original_width}x{original_height} -> {final_width}x{final_height}")
+                    break
+    
+    # Under load, one pass of the smallest model (or Lanczos alone) stands in for the plan
+    engine = ENGINE.name
+    if plan and ai_upscaled is None and level != "full":
+        light_plan = (min(ENGINE.scales),)
+        if level == "lanczos":
+            plan = None
+        elif light_plan != plan:
+            plan, engine = light_plan, engine_name(level)
+    
+    if plan:
+        timings.engines[target_resolution] = engine
+        if ai_upscaled is None:
+            print(f"Using AI upscaling ({plan_name(plan)}) for {original_width}x{original_height} -> {final_width}x{final_height}")
+            ai_upscaled = img
+            for scale in plan:
+                ai_upscaled = ai_upscale_image(ai_upscaled, scale, timings, target_resolution)
+            # A Lanczos fallback is not worth reusing as an AI intermediate, nor as a result
+            if timings.engines[target_resolution] != engine:
+                timings.fallbacks.add(target_resolution)
+            elif source_key:
+                SR_CACHE.put(f"{source_key}:{plan_name(plan)}", ai_upscaled)
         # Resize to exact target dimensions
-        return ai_upscaled.resize((final_width, final_height), Image.LANCZOS)
+        with timings.time("resize", target_resolution, timings.engines[target_resolution]):
+            return resize(ai_upscaled, (final_width, final_height))
     else:
-        # For very small or very large scale factors, use high-quality interpolation
+        # For very small scale factors (or beyond the pass limit, or under load), use high-quality interpolation
         print(f"Using Lanczos interpolation for scale factor {scale_factor:.2f}")
-        return img.resize((final_width, final_height), Image.LANCZOS)
+        timings.engines[target_resolution] = "Lanczos"
+        with timings.time("resize", target_resolution, "Lanczos"):
+            return resize(img, (final_width, final_height))
+
+
+def process_upscale(source, resolutions: list, output: OutputFormat, source_key: str = None,
+                    pipe: ChunkPipe = None, progress=None, timings: StageTimings = None, level: str = "full"):
+    """
+    Decode, upscale and encode an upload (spooled file or bytes) inside the worker pool
+    All requested presets share one decode and one AI inference
+    A single preset may be streamed into pipe instead (its bytes are then None)
+    progress(stage, fraction), if given, is called as each stage starts
+    Stage times, and the engine each preset used, are added to timings (a new StageTimings if not given)
+    Animations are decoded, upscaled and encoded frame by frame (see animation.py)
+    Returns a dict of encoded bytes per preset and the timings
+    """
+    timings = timings if timings is not None else StageTimings()
+    progress = progress or (lambda stage, fraction: None)
+    
+    start = time.perf_counter()
+    progress("decode", 0.0)
+    # Every preset is derived from one decode, sized for the largest of them
+    try:
+        img = validate_image(source, max(RESOLUTION_PRESETS[r] for r in resolutions))
+    except HTTPException as e:
+        raise UploadError(e.status_code, e.detail) from None
+    if is_animated(img):
+        return process_animation(img, resolutions, output, pipe, progress, timings, level), timings
+    img.load()
+    source_size = header_size(img)
+    img = prepare_image(img, output.keep_alpha)
+    timings.add("decode", time.perf_counter() - start, resolutions[0] if len(resolutions) == 1 else "all")
+    
+    # RGBA sources upscale differently from their flattened versions
+    if source_key and img.mode == 'RGBA':
+        source_key = f"{source_key}:rgba"
+    
+    # Largest preset first, so smaller ones can reuse its AI intermediate
+    outputs = {}
+    ordered = sorted(resolutions, key=lambda r: RESOLUTION_PRESETS[r][0], reverse=True)
+    for i, resolution in enumerate(ordered):
+        progress(f"upscale {resolution}", 0.05 + 0.9 * i / len(ordered))
+        upscaled_img = smart_resize_to_resolution(img, resolution, source_key, timings, level, source_size)
+        print(f"Upscaled to: {upscaled_img.size[0]}x{upscaled_img.size[1]}")
+        
+        progress(f"encode {resolution}", 0.05 + 0.9 * (i + 0.8) / len(ordered))
+        with timings.time("encode", resolution, timings.engines[resolution]):
+            if pipe is not None:
+                outputs[resolution] = None
+                write_to_pipe(pipe, lambda fp: encode_image(upscaled_img, output, fp))
+            else:
+                outputs[resolution] = encode_image(upscaled_img, output)
+    
+    return outputs, timings
+
+
+def process_animation(img: Image.Image, resolutions: list, output: OutputFormat, pipe: ChunkPipe, progress,
+                      timings: StageTimings, level: str) -> dict:
+    """
+    process_upscale for an animated upload: every frame through the engine, streamed
+    Frames are not cached as AI intermediates, and the level holds for the whole animation
+    """
+    print(f"Processing animation: {img.n_frames} frames")
+    outputs = upscale_animation(
+        img, resolutions, output,
+        lambda frame: {r: smart_resize_to_resolution(frame, r, None, timings, level) for r in resolutions},
+        timings, progress
+    )
+    # libwebp assembles the file at the end, so it goes into the pipe whole
+    if pipe is not None:
+        write_to_pipe(pipe, lambda fp: fp.write(outputs[resolutions[0]]))
+        outputs[resolutions[0]] = None
+    return outputs
+
+
+def package_outputs(outputs: dict, resolution: str, output: OutputFormat, original_name: str):
+    """
+    Turn encoded presets into one download: the image itself, or a ZIP for "all"
+    Returns (data, media type, filename); data is None for a streamed preset
+    """
+    if resolution != "all":
+        return outputs[resolution], output.media_type, f"{original_name}_{resolution}.{output.extension}"
+    
+    # Images are already compressed, so store them without deflate
+    output_buffer = io.BytesIO()
+    with zipfile.ZipFile(output_buffer, "w", zipfile.ZIP_STORED) as archive:
+        for preset, data in outputs.items():
+            archive.writestr(f"{original_name}_{preset}.{output.extension}", data)
+    return output_buffer.getvalue(), "application/zip", f"{original_name}_all.zip"
 
 
 @app.post("/api/upscale")
-@limiter.limit("10/hour")
 async def upscale_image(
     request: Request,
     file: UploadFile = File(...),
-    resolution: str = Form(...)
+    resolution: str = Form(...),
+    output_format: str = Form("png"),
+    quality: Optional[int] = Form(None),
+    alpha: str = Form("flatten")
 ):
     """
     AI-powered image upscaling to specified resolution
     
     Uses EDSR (Enhanced Deep Super-Resolution) neural network for true AI upscaling
     Falls back to high-quality Lanczos resampling if AI processing fails
+    Under heavy load, steps down to a lighter pass or Lanczos; X-AI-Upscaling names the engine used
     
-    Rate limit: 10 requests per hour per IP
+    Rate limit: 10 2K outputs per hour per API key or client (a 4K output counts as 3)
     Max file size: 20MB
-    Supported formats: JPG, JPEG, PNG, WebP, BMP
-    Output format: PNG
+    Supported formats: JPG, JPEG, PNG, WebP, BMP, GIF
+    Output format: PNG (default), WebP, lossless WebP or JPEG via output_format,
+    with quality as the format's level; "auto" picks WebP when Accept allows it.
+    Animated GIF and WebP uploads come out as animated WebP.
+    alpha=keep preserves transparency in PNG and WebP output (default: flatten onto white).
+    resolution=all returns a ZIP with one image per preset
     """
     try:
         # Validate resolution parameter
-        if resolution not in RESOLUTION_PRESETS:
+        if resolution != "all" and resolution not in RESOLUTION_PRESETS:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid resolution. Choose from: {', '.join(RESOLUTION_PRESETS.keys()).upper()}"
+                detail=f"Invalid resolution. Choose from: {', '.join([*RESOLUTION_PRESETS.keys(), 'all']).upper()}"
             )
+        presets = list(RESOLUTION_PRESETS) if resolution == "all" else [resolution]
         
-        # Read file
-        file_bytes = await file.read()
+        # Validate output format and quality
+        output = resolve_output_format(output_format, quality, request.headers.get("accept", ""), alpha)
         
-        # Check file size
-        if len(file_bytes) > MAX_FILE_SIZE:
+        # Size the spooled upload in place (the middleware already cut off oversized bodies)
+        upload = file.file
+        if upload_size(upload) > MAX_FILE_SIZE:
             raise HTTPException(
                 status_code=413,
                 detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
             )
+        output = output_for(upload, output)
         
-        # Validate and load image
-        img = validate_image(file_bytes)
+        # Serve repeat uploads straight from the result cache; under load, at a lower quality level
+        level = request_level()
+        digest = await asyncio.to_thread(content_digest, upload)
+        outputs, engines = cached_outputs(digest, presets, output, level)
+        missing = [preset for preset, data in outputs.items() if data is None]
+        cache_status = "MISS" if missing else "HIT"
+        timings = StageTimings()
+        body = None
         
-        # Perform AI upscaling
-        print(f"Processing image: {img.size[0]}x{img.size[1]} -> {resolution.upper()}")
-        upscaled_img = smart_resize_to_resolution(img, resolution)
-        print(f"Upscaled to: {upscaled_img.size[0]}x{upscaled_img.size[1]}")
+        # Validate image header before charging for or queueing any work (a cache hit needs no decode)
+        img = validate_image(upload, max(RESOLUTION_PRESETS[preset] for preset in missing)) if missing else None
+        
+        # Charge the client's quota by output size: only accepted uploads and cache hits are billed
+        quota.charge(request, output_cost([RESOLUTION_PRESETS[preset] for preset in presets]))
         
-        # Convert to PNG bytes
-        output_buffer = io.BytesIO()
-        upscaled_img.save(output_buffer, format='PNG', optimize=True)
-        output_buffer.seek(0)
+        if missing:
+            # Decode, AI upscale and encode in the worker pool. A single preset
+            # on thread workers is streamed as it is encoded; ZIPs and process
+            # workers are buffered
+            print(f"Processing image: {img.size[0]}x{img.size[1]} -> {resolution.upper()}")
+            pipe = None
+            if worker_pool.kind == "thread" and resolution != "all":
+                pipe = ChunkPipe(asyncio.get_running_loop(), keep=result_cache.entry_limit)
+            source = pipeline_source(upload, worker_pool.kind)
+            job = asyncio.ensure_future(worker_pool.run(
+                "pipeline", process_upscale, source, missing, output, cache_key(digest, "sr", engine_name()), pipe,
+                None, timings, level
+            ))
+            
+            def complete(result):
+                produced, finished = result
+                # Process workers send back a copy; thread workers filled timings itself
+                if finished is not timings:
+                    timings.merge(finished)
+                record_timings(timings)
+                for preset, data in produced.items():
+                    data = pipe.getvalue() if pipe is not None else data
+                    key = result_key(digest, preset, output, timings, level)
+                    if data is not None and key is not None:
+                        result_cache.put(key, data)
+                outputs.update(produced)
+            
+            try:
+                if pipe is not None:
+                    body = await open_stream(pipe, job, complete)
+                else:
+                    complete(await job)
+            except PoolFullError as e:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is busy. Please try again shortly.",
+                    headers={"Retry-After": str(e.retry_after)}
+                )
         
         # Generate filename
         original_name = os.path.splitext(file.filename)[0]
-        output_filename = f"{original_name}_{resolution}.png"
+        output_bytes, media_type, output_filename = package_outputs(outputs, resolution, output, original_name)
         
-        return StreamingResponse(
-            output_buffer,
-            media_type="image/png",
-            headers={
-                "Content-Disposition": f'attachment; filename="{output_filename}"',
-                "X-AI-Upscaling": "EDSR" if USE_AI_UPSCALING else "Lanczos"
-            }
-        )
+        # The engine each preset actually came from: its cache entry's, or the pipeline's
+        engines.update({preset: timings.engines.get(preset) for preset in missing})
+        
+        headers = {
+            "Content-Disposition": f'attachment; filename="{output_filename}"',
+            "X-AI-Upscaling": engines_header(engines),
+            "X-Cache": cache_status,
+            "Vary": "Accept",
+            # A streamed response leaves before its encode stage finishes
+            "Server-Timing": timings.server_timing(cache=cache_status)
+        }
+        
+        # Streamed output goes out chunked; buffered output gets a Content-Length
+        if body is not None:
+            return StreamingResponse(body, media_type=media_type, headers=headers)
+        return Response(content=output_bytes, media_type=media_type, headers=headers)
         
     except HTTPException as e:
         raise e
@@ -258,46 +610,360 @@ async def upscale_image(
         )
 
 
+async def upscale_batch_item(name: str, source, resolution: str, output: OutputFormat,
+                             level: str = "full") -> list:
+    """Upscale one image of a batch, every requested preset, through the caches and worker pool"""
+    presets = list(RESOLUTION_PRESETS) if resolution == "all" else [resolution]
+    output = output_for(source, output)
+    # Hashing a 20MB member would hold up the event loop
+    digest = await asyncio.to_thread(content_digest, source)
+    outputs, _ = cached_outputs(digest, presets, output, level)
+    missing = [preset for preset, data in outputs.items() if data is None]
+    if missing:
+        # Reject a bad image here, as /api/upscale does, before it reaches a worker
+        validate_image(source, max(RESOLUTION_PRESETS[preset] for preset in missing))
+        produced, timings = await worker_pool.run(
+            "pipeline", process_upscale, source, missing, output, cache_key(digest, "sr", engine_name()),
+            None, None, None, level
+        )
+        record_timings(timings)
+        for preset, data in produced.items():
+            key = result_key(digest, preset, output, timings, level)
+            if key is not None:
+                result_cache.put(key, data)
+        outputs.update(produced)
+    
+    stem = os.path.splitext(name)[0]
+    return [(f"{stem}_{preset}.{output.extension}", data) for preset, data in outputs.items()]
+
+
+@app.post("/api/batch")
+async def upscale_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    resolution: str = Form(...),
+    output_format: str = Form("png"),
+    quality: Optional[int] = Form(None),
+    alpha: str = Form("flatten")
+):
+    """
+    AI upscaling for many images in one request
+    
+    Send several files, or a single ZIP of images, as "files". The response is
+    a ZIP streamed as each image finishes; images that fail are listed in its
+    errors.txt. Max batch: 50 images, 200MB in total, 20MB per image.
+    resolution=all adds one entry per preset for every image
+    """
+    # Validate resolution parameter
+    if resolution != "all" and resolution not in RESOLUTION_PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid resolution. Choose from: {', '.join([*RESOLUTION_PRESETS.keys(), 'all']).upper()}"
+        )
+    
+    # Validate output format, quality and the batch itself before streaming
+    output = resolve_output_format(output_format, quality, request.headers.get("accept", ""), alpha)
+    inputs = batch_inputs(files, SUPPORTED_FORMATS, MAX_BATCH_FILES, MAX_FILE_SIZE, worker_pool.kind)
+    
+    # Every image costs its presets' output size
+    presets = list(RESOLUTION_PRESETS) if resolution == "all" else [resolution]
+    quota.charge(request, output_cost([RESOLUTION_PRESETS[preset] for preset in presets] * len(inputs)))
+    
+    # One quality level for the whole batch; its headers leave before any image is upscaled
+    level = request_level()
+    body = stream_batch(
+        inputs,
+        lambda name, source: upscale_batch_item(name, source, resolution, output, level),
+        worker_pool.max_workers
+    )
+    headers = {
+        "Content-Disposition": f'attachment; filename="upscaled_{resolution}.zip"',
+        "X-AI-Upscaling": engine_name(level),
+        "Vary": "Accept"
+    }
+    return StreamingResponse(body, media_type="application/zip", headers=headers)
+
+
+def upscale_file(path: str, output_dir: str, resolution: str, output: OutputFormat):
+    """Batch CLI worker: upscale one file into output_dir, one output per preset"""
+    presets = list(RESOLUTION_PRESETS) if resolution == "all" else [resolution]
+    engine = engine_name()
+    with open(path, "rb") as source:
+        output = output_for(source, output)
+        outputs, _ = process_upscale(source, presets, output, cache_key(content_digest(source), "sr", engine))
+    
+    names = []
+    pixels = 0
+    for preset, data in outputs.items():
+        name = f"{Path(path).stem}_{preset}.{output.extension}"
+        (Path(output_dir) / name).write_bytes(data)
+        width, height = Image.open(io.BytesIO(data)).size
+        names.append(name)
+        pixels += width * height
+    return names, pixels
+
+
+def run_job(job: dict, progress):
+    """
+    Job queue handler: the /api/upscale pipeline, run on a stored upload
+    Jobs always run at full quality: they are the way around a server shedding load
+    """
+    params = job["params"]
+    resolution = params["resolution"]
+    engine = params["engine"]
+    output = OutputFormat(params["output_format"], params["quality"], params.get("alpha", "flatten"))
+    with open(job["input_path"], "rb") as source:
+        output = output_for(source, output)
+    presets = list(RESOLUTION_PRESETS) if resolution == "all" else [resolution]
+    
+    outputs, engines = cached_outputs(params["digest"], presets, output)
+    missing = [preset for preset, data in outputs.items() if data is None]
+    if missing:
+        with open(job["input_path"], "rb") as source:
+            produced, timings = process_upscale(
+                source, missing, output, cache_key(params["digest"], "sr", engine), progress=progress
+            )
+        record_timings(timings)
+        for preset, data in produced.items():
+            key = result_key(params["digest"], preset, output, timings, "full")
+            if key is not None:
+                result_cache.put(key, data)
+        outputs.update(produced)
+        engines.update({preset: timings.engines.get(preset) for preset in missing})
+    
+    # Kept with the job row for the result's X-AI-Upscaling
+    params["engines"] = engines_header(engines)
+    return package_outputs(outputs, resolution, output, params["name"])
+
+
+# Persistent queue for /api/jobs (PIXELFORGE_JOB_* to override)
+job_queue = jobs_from_env(run_job)
+
+
+def job_status(job: dict) -> dict:
+    """Public view of a job row"""
+    status = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": round(job["progress"], 3),
+        "resolution": job["params"]["resolution"],
+        "created": job["created"],
+        "started": job["started"],
+        "finished": job["finished"]
+    }
+    if job["status"] == "queued":
+        status["queue_position"] = job["position"]
+    if job["status"] == "failed":
+        status["error"] = job["error"]
+    if job["status"] == "done":
+        status["result_url"] = f"/api/jobs/{job['id']}/result"
+    return status
+
+
+def get_job_or_404(job_id: str) -> dict:
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+
+@app.post("/api/jobs", status_code=202)
+async def submit_job(
+    request: Request,
+    file: UploadFile = File(...),
+    resolution: str = Form(...),
+    output_format: str = Form("png"),
+    quality: Optional[int] = Form(None),
+    alpha: str = Form("flatten")
+):
+    """
+    Queue an upscale and return its job id straight away
+    
+    Takes the same fields as /api/upscale. Poll /api/jobs/{job_id} (or follow
+    /api/jobs/{job_id}/events) and download /api/jobs/{job_id}/result when done
+    """
+    # Validate resolution parameter
+    if resolution != "all" and resolution not in RESOLUTION_PRESETS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid resolution. Choose from: {', '.join([*RESOLUTION_PRESETS.keys(), 'all']).upper()}"
+        )
+    presets = list(RESOLUTION_PRESETS) if resolution == "all" else [resolution]
+    
+    # Validate output format, quality and the upload before queueing anything
+    output = resolve_output_format(output_format, quality, request.headers.get("accept", ""), alpha)
+    upload = file.file
+    if upload_size(upload) > MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File too large. Maximum size: {MAX_FILE_SIZE // (1024*1024)}MB"
+        )
+    validate_image(upload, max(RESOLUTION_PRESETS[preset] for preset in presets))
+    
+    # Charge only once the upload has passed validation
+    quota.charge(request, output_cost([RESOLUTION_PRESETS[preset] for preset in presets]))
+    digest = await asyncio.to_thread(content_digest, upload)
+    
+    params = {
+        "resolution": resolution,
+        "output_format": output.name,
+        "quality": output.quality,
+        "alpha": output.alpha,
+        "engine": engine_name(),
+        "digest": digest,
+        "name": os.path.splitext(file.filename)[0]
+    }
+    try:
+        job_id = job_queue.submit(upload, params)
+    except PoolFullError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Job queue is full. Please try again later.",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    
+    return {
+        **job_status(job_queue.get(job_id)),
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events",
+        "result_url": f"/api/jobs/{job_id}/result"
+    }
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and progress of a queued job"""
+    return job_status(get_job_or_404(job_id))
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events with the job's status, one per change, until it finishes"""
+    get_job_or_404(job_id)
+    
+    async def events():
+        last = None
+        while True:
+            job = job_queue.get(job_id)
+            if job is None:
+                break
+            status = job_status(job)
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+            if job["status"] in TERMINAL_STATUSES:
+                break
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/api/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Download a finished job's image (or ZIP for resolution=all)"""
+    job = get_job_or_404(job_id)
+    if job["status"] == "failed":
+        raise HTTPException(status_code=409, detail=f"Job failed: {job['error']}")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is not finished yet ({job['status']})")
+    
+    return FileResponse(
+        str(job_queue.result_path(job_id)),
+        media_type=job["media_type"],
+        filename=job["filename"],
+        headers={"X-AI-Upscaling": job["params"].get("engines") or job["params"]["engine"]}
+    )
+
+
+@app.get("/api/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving requests"""
+    return {"status": "alive"}
+
+
+@app.get("/api/health/ready")
+async def readiness():
+    """Readiness probe: 503 until the models are loaded and warmed up"""
+    if not AI_READY.is_set():
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming up"},
+            headers={"Retry-After": "5"}
+        )
+    return {
+        "status": "ready",
+        "ai_models": ENGINE.loaded(),
+        "warmup_seconds": round(AI_WARMUP_SECONDS, 2) if AI_WARMUP_SECONDS is not None else None
+    }
+
+
 @app.get("/api/info")
 async def get_info():
     """Get information about the AI upscaling service"""
-    device = 'cuda' if torch.cuda.is_available() else 'cpu'
     return {
         "service": "PixelForge AI Upscaler",
         "version": "2.0.0",
         "ai_enabled": USE_AI_UPSCALING,
-        "ai_model": "EDSR (Enhanced Deep Super-Resolution)" if USE_AI_UPSCALING else None,
-        "device": device,
+        "ai_model": None,
+        "ai_scales": [],
+        **ENGINE.info(),
+        "ai_max_passes": AI_MAX_PASSES,
+        "latency_slo_seconds": POLICY.slo_seconds if POLICY.enabled else None,
         "supported_resolutions": list(RESOLUTION_PRESETS.keys()),
+        "multi_output_resolution": "all",
+        "async_jobs": "POST /api/jobs",
+        "batch_upscale": "POST /api/batch",
+        "max_batch_files": MAX_BATCH_FILES,
         "supported_formats": list(SUPPORTED_FORMATS),
+        "output_formats": [*OUTPUT_FORMATS, "auto"],
+        "alpha_modes": list(ALPHA_MODES),
         "max_file_size_mb": MAX_FILE_SIZE // (1024 * 1024),
-        "rate_limit": "10 requests per hour per IP"
+        "max_animation_frames": MAX_FRAMES,
+        "rate_limit": f"{quota.default_limit} per API key or client, one per 2K output"
+    }
+
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition: stage latency histograms, queue depth, caches, model load and RSS"""
+    return Response(content=METRICS.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/api/stats")
+async def get_stats():
+    """Worker pool load, per-stage timings, result cache and inference batching"""
+    return {
+        "worker_pool": worker_pool.stats(),
+        "result_cache": result_cache.stats(),
+        "sr_cache": SR_CACHE.stats(),
+        "jobs": job_queue.stats(),
+        "load_policy": POLICY.stats(),
+        **ENGINE.stats()
     }
 
 
-# Mount static files for frontend (only if directory exists)
-if FRONTEND_DIR.exists() and (FRONTEND_DIR / "assets").exists():
-    app.mount("/assets", StaticFiles(directory=str(FRONTEND_DIR / "assets")), name="assets")
+# Serve the built frontend from memory, precompressed and with cache validators (only if it exists)
+if FRONTEND_DIR.exists() and (FRONTEND_DIR / "index.html").exists():
+    FRONTEND = StaticSite(FRONTEND_DIR)
     
     @app.get("/")
-    async def serve_frontend():
+    async def serve_frontend(request: Request):
         """Serve the frontend application"""
-        return FileResponse(str(FRONTEND_DIR / "index.html"))
+        return FRONTEND.index.response(request.headers)
     
     @app.get("/{full_path:path}")
-    async def serve_frontend_routes(full_path: str):
+    async def serve_frontend_routes(full_path: str, request: Request):
         """Serve frontend for all other routes (SPA routing)"""
         # Check if it's an API call
         if full_path.startswith("api/"):
             raise HTTPException(status_code=404, detail="Not found")
         
-        # Check if file exists
-        file_path = FRONTEND_DIR / full_path
-        if file_path.exists() and file_path.is_file():
-            return FileResponse(str(file_path))
-        
-        # Default to index.html for SPA routing
-        return FileResponse(str(FRONTEND_DIR / "index.html"))
+        # Files, then index.html for SPA routes; a missing asset is a 404
+        file = FRONTEND.lookup(full_path)
+        if file is None:
+            raise HTTPException(status_code=404, detail="Not found")
+        return file.response(request.headers)
 else:
     @app.get("/")
     async def root():
@@ -308,18 +974,38 @@ else:
             "ai_enabled": USE_AI_UPSCALING,
             "endpoints": {
                 "upscale": "POST /api/upscale",
+                "jobs": "POST /api/jobs",
+                "batch": "POST /api/batch",
+                "live": "GET /api/health/live",
+                "ready": "GET /api/health/ready",
                 "info": "GET /api/info"
             }
         }
 
 
-if __name__ == "__main__":
+def main():
+    """Command line entry point: serve the app, or run the batch CLI"""
+    # Offline bulk mode: python server_ai.py (or main.py) batch INPUT_DIR OUTPUT_DIR [--resolution 4k ...]
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        sys.exit(batch_cli(
+            sys.argv[2:], upscale_file, [*RESOLUTION_PRESETS, "all"], SUPPORTED_FORMATS,
+            partial(init_worker_process, None)
+        ))
+    
     import uvicorn
     print("=" * 60)
     print("PixelForge AI Upscaler - Real AI Edition")
     print("=" * 60)
     print(f"AI Upscaling: {'ENABLED' if USE_AI_UPSCALING else 'DISABLED'}")
-    print(f"Device: {'GPU (CUDA)' if torch.cuda.is_available() else 'CPU'}")
-    print("AI Model: EDSR (Enhanced Deep Super-Resolution)")
+    print(f"Engine: {ENGINE.name}")
+    print(f"Device: {'GPU (CUDA)' if ENGINE.device == 'cuda' else 'CPU'}")
+    print(f"Workers: {SERVER_WORKERS}")
     print("=" * 60)
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    if SERVER_WORKERS > 1:
+        serve_workers(app, "0.0.0.0", 8000, SERVER_WORKERS, preload_models, init_worker_process)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
+
+
+if __name__ == "__main__":
+    main()
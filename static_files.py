@@ -0,0 +1,138 @@
+"""
+In-memory serving of the built frontend
+
+FileResponse stats and opens the file on every request, sends it
+uncompressed and without validators, so each page load re-downloads the
+whole bundle through the same event loop the upscale requests use.
+StaticSite reads the frontend directory once at startup and keeps each file
+with its gzip (and, when the brotli package is installed, brotli) variants,
+compressed at the highest level once rather than per request. Requests are
+answered from memory, with no filesystem calls:
+
+- every variant has a strong ETag, and a matching If-None-Match gets a 304
+- hashed build outputs (index-KBcNb3LD.js, main.3f2a1b4c.css) never change
+  under their name, so they are cached as immutable for a year
+- everything else (index.html above all) is revalidated on each use
+
+In a multi-worker server the index is built before the fork, so the workers
+share it.
+"""
+import gzip
+import hashlib
+import mimetypes
+import re
+from pathlib import Path
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None  # gzip only
+
+# A content hash of 8+ characters (with a digit or capital) just before the extension
+HASHED_NAME = re.compile(r"[.-](?=[\w-]*[0-9A-Z])[\w-]{8,}\.\w+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+# Smaller files, and variants that save less than a tenth, are sent as they are
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "application/xml",
+                      "image/svg+xml", "application/wasm", "application/manifest+json")
+
+COMPRESSORS = {"gzip": lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+if brotli is not None:
+    COMPRESSORS = {"br": lambda data: brotli.compress(data, quality=11), **COMPRESSORS}
+
+
+def accepted_encodings(header: str) -> set:
+    """Content codings an Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        if coding.strip() and weight > 0:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class StaticFile:
+    """One file's bytes and precompressed variants, each with its own ETag"""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        tag = hashlib.sha256(body).hexdigest()[:20]
+        self.variants = {None: (body, f'"{tag}"')}  # content coding -> (bytes, ETag)
+        if len(body) >= MIN_COMPRESS_BYTES and media_type.startswith(COMPRESSIBLE_TYPES):
+            for coding, compress in COMPRESSORS.items():
+                data = compress(body)
+                if len(data) < len(body) * 0.9:
+                    self.variants[coding] = (data, f'"{tag}-{coding}"')
+        self.etags = {etag for _, etag in self.variants.values()}
+
+    def nbytes(self) -> int:
+        return sum(len(data) for data, _ in self.variants.values())
+
+    def response(self, headers) -> Response:
+        """The smallest variant the client accepts, or a 304 when its cached copy is current"""
+        coding = None
+        if len(self.variants) > 1:
+            accepted = accepted_encodings(headers.get("accept-encoding", ""))
+            coding = next((c for c in self.variants if c in accepted), None)
+        body, etag = self.variants[coding]
+
+        response_headers = {"ETag": etag, "Cache-Control": self.cache_control}
+        if len(self.variants) > 1:
+            response_headers["Vary"] = "Accept-Encoding"
+
+        # Any variant's tag validates: they all decode to the same bytes
+        if_none_match = headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+            if "*" in tags or tags & self.etags:
+                return Response(status_code=304, headers=response_headers)
+
+        if coding is not None:
+            response_headers["Content-Encoding"] = coding
+        return Response(content=body, media_type=self.media_type, headers=response_headers)
+
+
+class StaticSite:
+    """
+    A single-page app's build directory, read into memory
+    Paths that are not files get index.html, except under asset_prefix
+    """
+
+    def __init__(self, directory, index: str = "index.html", asset_prefix: str = "assets/"):
+        directory = Path(directory)
+        self.asset_prefix = asset_prefix
+        self.files = {}
+        for path in sorted(directory.rglob("*")):
+            if not path.is_file():
+                continue
+            name = path.relative_to(directory).as_posix()
+            media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+            cache_control = IMMUTABLE if HASHED_NAME.search(name) else REVALIDATE
+            self.files[name] = StaticFile(path.read_bytes(), media_type, cache_control)
+        self.index = self.files[index]
+        print(f"Frontend indexed: {len(self.files)} files, {self.nbytes() / (1024 * 1024):.1f}MB with variants")
+
+    def nbytes(self) -> int:
+        return sum(file.nbytes() for file in self.files.values())
+
+    def lookup(self, path: str):
+        """The file for a request path: the file itself, else index.html, or None for a missing asset"""
+        file = self.files.get(path.strip("/"))
+        if file is not None:
+            return file
+        if path.lstrip("/").startswith(self.asset_prefix):
+            return None
+        return self.index
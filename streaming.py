@@ -0,0 +1,133 @@
+"""
+Chunked streaming of encoded output from a worker thread
+
+The encoder writes into a ChunkPipe, a file-like sink that cuts the output
+into fixed-size chunks and hands them to the event loop through a bounded
+queue. The response body drains that queue while the encoder keeps going, so
+transmission overlaps compression and at most max_chunks chunks are held per
+response. When the queue is full the encoder blocks (backpressure); when the
+client disconnects the next write raises and the encode is abandoned.
+
+Only thread pools can stream: a process-pool worker cannot write into the
+parent's queue, so callers fall back to a fully buffered response there.
+
+A pipe can also keep a copy of what it sent, for the result cache. The copy
+is written into one growing buffer that getvalue() hands over without a
+second copy, and it is dropped once it passes the keep limit. A streamed
+response that is cached therefore holds one full copy, like a buffered one.
+Only streamed responses that are not cached hold just the queued chunks.
+"""
+import asyncio
+import io
+
+
+class ChunkPipe:
+    """File-like sink written by a worker thread and drained by the event loop"""
+
+    def __init__(self, loop, chunk_size: int = 64 * 1024, max_chunks: int = 8, keep: int = 0):
+        self.chunk_size = chunk_size
+        self.keep = keep  # bytes of output to keep for getvalue() (0 keeps none)
+        self._loop = loop
+        self._queue = asyncio.Queue(max_chunks)
+        self._buffer = bytearray()
+        self._kept = io.BytesIO() if keep else None
+        self._closed = False
+
+    # Producer side, called from the worker thread
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.chunk_size:
+            chunk = bytes(self._buffer[:self.chunk_size])
+            del self._buffer[:self.chunk_size]
+            self._put(chunk)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def finish(self):
+        """Send any buffered bytes and mark the end of the stream"""
+        if self._buffer:
+            self._put(bytes(self._buffer))
+            self._buffer.clear()
+        self._put(None)
+
+    def fail(self, error: BaseException):
+        """Abort the stream so the consumer raises instead of ending cleanly"""
+        if not self._closed:
+            asyncio.run_coroutine_threadsafe(self._queue.put(error), self._loop).result()
+
+    def getvalue(self) -> bytes:
+        """Everything written so far, or None if nothing was kept or the output outgrew the keep limit"""
+        return self._kept.getvalue() if self._kept is not None else None
+
+    def _put(self, item):
+        if self._closed:
+            raise BrokenPipeError("Client disconnected before the output was sent")
+        if self._kept is not None and item is not None:
+            # Too big to cache: stop holding a copy of it
+            if self._kept.tell() + len(item) > self.keep:
+                self._kept = None
+            else:
+                self._kept.write(item)
+        asyncio.run_coroutine_threadsafe(self._queue.put(item), self._loop).result()
+
+    # Consumer side, called on the event loop
+
+    async def get(self):
+        item = await self._queue.get()
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def close(self):
+        """Stop consuming and unblock a producer waiting on a full queue"""
+        self._closed = True
+        while not self._queue.empty():
+            self._queue.get_nowait()
+
+
+def write_to_pipe(pipe: ChunkPipe, encode):
+    """Run encode(pipe) in the worker, always ending or failing the stream"""
+    try:
+        encode(pipe)
+    except BaseException as e:
+        pipe.fail(e)
+        raise
+    pipe.finish()
+
+
+async def open_stream(pipe: ChunkPipe, job: asyncio.Future, on_complete=None):
+    """
+    Wait for the first chunk, then return an async iterator over the body
+
+    Errors raised by the job before any output (busy pool, decode or upscale
+    failure) propagate here, while a proper error status can still be sent.
+    on_complete receives the job's result once the last chunk is out.
+    """
+    # Failures after a client went away would otherwise go unretrieved
+    job.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+    getter = asyncio.ensure_future(pipe.get())
+    done, _ = await asyncio.wait({getter, job}, return_when=asyncio.FIRST_COMPLETED)
+    if getter not in done:
+        if job.exception() is not None:
+            getter.cancel()
+            pipe.close()
+            raise job.exception()
+    first = await getter
+
+    async def body():
+        try:
+            chunk = first
+            while chunk is not None:
+                yield chunk
+                chunk = await pipe.get()
+            result = await job
+            if on_complete is not None:
+                on_complete(result)
+        finally:
+            pipe.close()
+
+    return body()
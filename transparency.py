@@ -0,0 +1,43 @@
+"""
+Transparency handling around the upscalers
+
+EDSR only sees colour, so transparent uploads used to be composited onto
+white and lost their alpha channel. In "keep" mode the colour channels go
+through the upscaler as usual, while the alpha channel is resized with a
+cheap bicubic filter. Alpha is smooth mask data the model was never
+trained on. conversion.resize_alpha_into writes it straight into the fourth
+channel of the upscaler's output array, so the RGBA result costs no extra
+full-frame copies. This module itself needs only Pillow, so the Lanczos
+engine can use it without NumPy.
+"""
+from PIL import Image
+
+ALPHA_RESAMPLE = Image.BICUBIC
+
+
+def has_alpha(img: Image.Image) -> bool:
+    """Whether an image has an alpha channel or a transparent palette/colour key"""
+    return img.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in img.info
+
+
+def flatten(img: Image.Image) -> Image.Image:
+    """Composite a transparent image onto white"""
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    background = Image.new("RGB", img.size, (255, 255, 255))
+    # getchannel copies the one band the mask needs, where split() copied all four
+    background.paste(img, mask=img.getchannel("A"))
+    return background
+
+
+def prepare_image(img: Image.Image, keep_alpha: bool = False) -> Image.Image:
+    """
+    RGB image for the upscalers, or RGBA when keeping an image's transparency
+    Transparent images are otherwise flattened onto white
+    """
+    if has_alpha(img):
+        if keep_alpha:
+            return img if img.mode == "RGBA" else img.convert("RGBA")
+        return flatten(img)
+    return img if img.mode == "RGB" else img.convert("RGB")
+
@@ -0,0 +1,124 @@
+"""
+Bounded, spooled ingestion of uploaded images
+
+Starlette's multipart parser spools each file part into a
+SpooledTemporaryFile (in memory up to 1MB, then on disk), but it parses the
+whole request before the handler runs. UploadLimitMiddleware enforces the
+size cap while the body is still arriving: a Content-Length over the limit
+is refused before any of the body is read, and a body without one is cut off
+as soon as it crosses the limit. Handlers then size, hash and validate the
+spooled file in place and hand that file object to the pipeline instead of a
+bytes copy of it.
+
+Pixel dimensions are bounded the same way, from the header: JPEGs larger
+than the requested preset are put in draft mode first, so libjpeg decodes
+straight at 1/2, 1/4 or 1/8 scale, and the pixel budget applies to what
+will actually be decoded.
+"""
+import io
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+# Allowance for multipart boundaries and the small form fields
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+class UploadError(HTTPException):
+    """
+    HTTPException that survives pickling, for rejections raised inside
+    process-pool workers (a plain one fails to unpickle and breaks the pool)
+    """
+
+    def __reduce__(self):
+        return type(self), (self.status_code, self.detail, self.headers)
+
+
+class UploadLimitMiddleware:
+    """
+    ASGI middleware rejecting request bodies over max_bytes with 413
+    path_limits maps a request path to its own (max_bytes, detail)
+    """
+
+    def __init__(self, app, max_bytes: int, detail: str = "Request body too large", path_limits: dict = None):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.detail = detail
+        self.path_limits = path_limits or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT", "PATCH"):
+            await self.app(scope, receive, send)
+            return
+        max_bytes, detail = self.path_limits.get(scope["path"], (self.max_bytes, self.detail))
+
+        # Refuse declared oversized bodies without reading them
+        content_length = dict(scope["headers"]).get(b"content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > max_bytes:
+            response = JSONResponse({"detail": detail}, status_code=413, headers={"Connection": "close"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_bytes:
+                    # Raised inside form parsing, so FastAPI answers with this status
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def upload_size(fp) -> int:
+    """Size of a spooled upload without reading it"""
+    fp.seek(0, io.SEEK_END)
+    size = fp.tell()
+    fp.seek(0)
+    return size
+
+
+def open_source(source):
+    """A rewound binary file for an upload given as bytes or as a file object"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    source.seek(0)
+    return source
+
+
+def pipeline_source(fp, pool_kind: str):
+    """
+    What to send to the worker pool for a spooled upload: thread workers read
+    the spooled file itself, process workers need the bytes pickled over
+    """
+    if pool_kind == "process":
+        fp.seek(0)
+        return fp.read()
+    return fp
+
+
+def draft_to_target(img, box: tuple):
+    """
+    Have a JPEG decode at the largest power-of-two reduction that still
+    covers its aspect-fitted size inside box. Only the header is touched:
+    img.size reports the reduced size at once, and img.load() decodes at it.
+    libjpeg rounds the reduced size up, which shifts the aspect ratio
+    slightly, so the header size is kept for fitting (see header_size)
+    """
+    if img.format != "JPEG":
+        return img
+    width, height = img.size
+    scale = min(box[0] / width, box[1] / height)
+    if scale < 0.5:
+        img.header_size = img.size
+        img.draft(None, (max(1, round(width * scale)), max(1, round(height * scale))))
+    return img
+
+
+def header_size(img) -> tuple:
+    """An image's size as its header gives it, before any draft reduction"""
+    return getattr(img, "header_size", img.size)
@@ -0,0 +1,154 @@
+"""
+Bounded worker pool for the CPU-bound upscale pipeline
+
+Decode, upscale and encode run in a thread or process pool instead of on the
+asyncio event loop, so health checks and /api/info stay responsive while a
+4K job is running. Admission control rejects work once every worker is busy
+and the wait queue is full, so callers can answer 503 with Retry-After.
+"""
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import math
+import os
+import threading
+import time
+
+
+class PoolFullError(Exception):
+    """Raised when the pool has no free worker and no free queue slot"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Worker pool is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class StageStats:
+    """Accumulated queue-wait and run times for one pipeline stage"""
+
+    def __init__(self):
+        self.count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.run_total = 0.0
+        self.run_max = 0.0
+
+    def record(self, wait: float, run: float):
+        self.count += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.run_total += run
+        self.run_max = max(self.run_max, run)
+
+    def to_dict(self) -> dict:
+        count = self.count or 1
+        return {
+            "count": self.count,
+            "wait_avg_ms": round(self.wait_total / count * 1000, 2),
+            "wait_max_ms": round(self.wait_max * 1000, 2),
+            "run_avg_ms": round(self.run_total / count * 1000, 2),
+            "run_max_ms": round(self.run_max * 1000, 2),
+        }
+
+
+def _timed_call(fn, args):
+    """Run fn in the worker and report when it started and how long it took"""
+    started = time.time()
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return started, time.perf_counter() - t0, result
+
+
+class WorkerPool:
+    """
+    Thread or process pool with a bounded queue in front of it
+
+    max_workers jobs run at once and up to max_queue more may wait; anything
+    beyond that raises PoolFullError without being queued.
+    """
+
+    def __init__(self, max_workers: int = None, max_queue: int = None, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = self.max_workers * 2 if max_queue is None else max_queue
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upscale")
+        self.stages = {}
+        self.rejected = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return self.max_workers + self.max_queue
+
+    def record(self, stage: str, wait: float, run: float):
+        """Add one timing sample for a stage"""
+        with self._lock:
+            self.stages.setdefault(stage, StageStats()).record(wait, run)
+
+    def retry_after(self) -> int:
+        """Estimate how long until a queue slot frees up, in whole seconds"""
+        with self._lock:
+            return self._retry_after()
+
+    def _retry_after(self) -> int:
+        # Called with _lock held, so stages and _pending are read together
+        stats = self.stages.get("pipeline")
+        avg_run = stats.run_total / stats.count if stats and stats.count else 1.0
+        queued = max(self._pending - self.max_workers + 1, 1)
+        return max(1, math.ceil(avg_run * queued / self.max_workers))
+
+    async def run(self, stage: str, fn, *args):
+        """Run fn(*args) in the pool, timing queue wait and execution under stage"""
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise PoolFullError(self._retry_after())
+            self._pending += 1
+        submitted = time.time()
+        try:
+            future = self.executor.submit(_timed_call, fn, args)
+        except BaseException:
+            self._release()
+            raise
+        # A cancelled caller stops waiting, but a running fn keeps its worker until it returns,
+        # so the slot is freed when the work ends rather than in this coroutine
+        future.add_done_callback(self._release)
+        started, run, result = await asyncio.wrap_future(future)
+        self.record(stage, max(started - submitted, 0.0), run)
+        return result
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self) -> dict:
+        """Pool configuration, current load and per-stage timings"""
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": min(self._pending, self.max_workers),
+                "queued": max(self._pending - self.max_workers, 0),
+                "rejected": self.rejected,
+                "stages": {name: s.to_dict() for name, s in self.stages.items()},
+            }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def pool_from_env(default_workers: int = None) -> WorkerPool:
+    """Build a WorkerPool from PIXELFORGE_POOL_* environment variables"""
+    workers = os.environ.get("PIXELFORGE_POOL_WORKERS")
+    queue = os.environ.get("PIXELFORGE_POOL_QUEUE")
+    return WorkerPool(
+        max_workers=int(workers) if workers else default_workers,
+        max_queue=int(queue) if queue else None,
+        kind=os.environ.get("PIXELFORGE_POOL_KIND", "thread"),
+    )